@@ -0,0 +1,36 @@
+#! /usr/bin/env python
+import rospy
+from thr_infrastructure_msgs.msg import ActionHistoryEvent
+from thr_infrastructure_msgs.srv import GetActionHistory, GetActionHistoryResponse
+from thr_action_server import ActionHistory
+from threading import Lock
+
+
+class ActionHistoryServer(object):
+    """
+    Keeps a bounded history of /thr/action_history and serves it through /thr/get_action_history,
+    so that late joiners catch up with running actions without replaying the topic.
+    """
+    def __init__(self, size):
+        self.lock = Lock()
+        self.history = ActionHistory(size)
+        self.action_history_name = '/thr/action_history'
+        self.service_name = '/thr/get_action_history'
+        rospy.Subscriber(self.action_history_name, ActionHistoryEvent, self.cb_action_event_received, queue_size=100)
+        rospy.Service(self.service_name, GetActionHistory, self.cb_get_action_history)
+
+    def cb_action_event_received(self, event):
+        with self.lock:
+            self.history.add(event)
+
+    def cb_get_action_history(self, request):
+        with self.lock:
+            return GetActionHistoryResponse(events=self.history.last(request.last, request.side, request.type),
+                                            running=list(self.history.running.values()),
+                                            stats=self.history.duration_stats())
+
+
+if __name__ == '__main__':
+    rospy.init_node('action_history_server')
+    ActionHistoryServer(rospy.get_param('~size', 1000))
+    rospy.spin()
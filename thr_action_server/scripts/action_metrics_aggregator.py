@@ -0,0 +1,43 @@
+#! /usr/bin/env python
+import os
+import rospy
+import rospkg
+import json
+from thr_infrastructure_msgs.msg import ActionMetrics
+from thr_action_server import MetricsAggregator
+from threading import Lock
+
+
+class ActionMetricsAggregator(object):
+    """
+    Aggregates /thr/action_metrics into histograms per action type and phase, dumped in JSON at shutdown
+    """
+    def __init__(self, output):
+        self.rospack = rospkg.RosPack()
+        with open(self.rospack.get_path("thr_action_server")+"/config/action_params.json") as f:
+            self.action_params = json.load(f)
+        self.output = output
+        self.lock = Lock()
+        self.aggregator = MetricsAggregator(self.action_params['metrics']['bins'])
+        rospy.Subscriber('/thr/action_metrics', ActionMetrics, self.cb_metrics, queue_size=100)
+        rospy.on_shutdown(self.dump)
+
+    def cb_metrics(self, msg):
+        with self.lock:
+            self.aggregator.add(msg)
+        rospy.loginfo("[ActionMetrics] {}{} in {:.2f}s: {}".format(msg.action.type, str(msg.action.parameters), msg.total,
+                      ", ".join("{} {:.2f}s".format(p, d) for p, d in zip(msg.phases, msg.durations))))
+
+    def dump(self):
+        with self.lock:
+            for duration, type, phase in self.aggregator.slowest_phases()[:5]:
+                rospy.loginfo("[ActionMetrics] Slowest phases: {} {} {:.2f}s on average".format(type, phase, duration))
+            with open(self.output, 'w') as f:
+                json.dump(self.aggregator.to_dict(), f, indent=4, sort_keys=True)
+        rospy.loginfo("[ActionMetrics] Histograms written in {}".format(self.output))
+
+
+if __name__ == '__main__':
+    rospy.init_node('action_metrics_aggregator')
+    ActionMetricsAggregator(rospy.get_param('~output', os.path.join(rospkg.get_ros_home(), 'thr_action_metrics.json')))
+    rospy.spin()
@@ -3,28 +3,49 @@ import rospy
 import json
 import rospkg
 import actionlib
+from threading import Thread, Lock
+from collections import deque
 
 from actionlib_msgs.msg import GoalStatus
 from thr_infrastructure_msgs.srv import StartStopEpisode, StartStopEpisodeRequest, StartStopEpisodeResponse
-from thr_infrastructure_msgs.msg import RunRobotActionAction, RunRobotActionGoal, RunDecisionGoal, RunDecisionAction, ActionHistoryEvent, Decision
+from thr_infrastructure_msgs.msg import RunRobotActionAction, RunRobotActionGoal, RunDecisionGoal, RunDecisionAction, ActionHistoryEvent, Decision, EpisodeProgress
+from thr_scenes import SceneModel
+from thr_action_server import Tracer
 
 class DecisionServer:
     """
     This is the action server that transforms a Decision in Robot action for the concurrent system.
+    Each arm has its own queue of robot actions, so that a decision for a free arm is dispatched immediately
+    whatever the other arm is doing. What happens to a decision for a busy arm is the preemption policy of that arm:
+    * preempt: the running action is interrupted and the new one starts immediately
+    * queue: the new action starts when the running one ends
+    * ignore: the new action is dropped
     """
+    POLICIES = ['preempt', 'queue', 'ignore']
+
     def __init__(self):
         # Action server attributes
         self.sequence = 1
-        self.server = actionlib.SimpleActionServer('/thr/run_decision', RunDecisionAction, self.execute, False)
+        self.server = actionlib.ActionServer('/thr/run_decision', RunDecisionAction, self.cb_goal, auto_start=False)
         self.rospack = rospkg.RosPack()
+        self.lock = Lock()
         self.current_actions = {'right': None, 'left': None}
+        self.queues = {'right': deque(), 'left': deque()}
         self.action_history_name = '/thr/action_history'
-        self.action_history = rospy.Publisher(self.action_history_name, ActionHistoryEvent, queue_size=10)
+        self.action_history = rospy.Publisher(self.action_history_name, ActionHistoryEvent, queue_size=100)
+        self.episode_progress = rospy.Publisher('/thr/episode_progress', EpisodeProgress, queue_size=10)
+        self.tracer = Tracer('decision_server')
+        self.episode = 0  # Incremented at each START, to know if a background homing belongs to the current episode
 
-        with open(self.rospack.get_path("thr_action_server")+"/config/decision_action_mapping.json") as f:
-            self.mapping = json.load(f)
+        self.scene = rospy.get_param('/thr/scene')
+        self.model = SceneModel.load(self.scene, rospy.get_param('/thr/objects')[self.scene], self.rospack)
         with open(self.rospack.get_path("thr_action_server")+"/config/action_params.json") as f:
             self.action_params = json.load(f)
+        self.policies = self.action_params['decision_server']['preemption']
+        self.max_queue = self.action_params['decision_server']['max_queue']
+        for side, policy in self.policies.items():
+            if policy not in self.POLICIES:
+                raise ValueError("Unknown preemption policy {} for arm {}, expected one of {}".format(policy, side, self.POLICIES))
 
         # Connect to inner action servers L/R
         self.clients = {'left': actionlib.SimpleActionClient('/thr/robot_run_action/left', RunRobotActionAction),
@@ -33,84 +54,149 @@ class DecisionServer:
             rospy.loginfo('Decision server for concurrent mode is waiting for action server '+name)
             client.wait_for_server()
 
-        self.server.start()
         self.start_stop_service_name = '/thr/action_server/start_stop'
         rospy.Service(self.start_stop_service_name, StartStopEpisode, self.cb_start_stop)
 
     def cb_start_stop(self, request):
         if request.command == StartStopEpisodeRequest.START:
+            self.episode += 1
             rospy.set_param('/thr/action_server/stopped', False)
         elif request.command == StartStopEpisodeRequest.STOP:
+            with self.lock:
+                for queue in self.queues.values():
+                    queue.clear()
             self.clients['left'].cancel_all_goals()
             self.clients['right'].cancel_all_goals()
-            # Execute the go_homes and wait for them before stopping
+            # Both arms go home at the same time, the reply does not wait for them
             self.execute(RunDecisionGoal(decision=Decision(type='start_go_home_left')), force=True)
             self.execute(RunDecisionGoal(decision=Decision(type='start_go_home_right')), force=True)
+            Thread(target=self.wait_for_homing, args=(self.episode,)).start()
+            return StartStopEpisodeResponse(background=['homing'])
+        return StartStopEpisodeResponse()
+
+    def wait_for_homing(self, episode):
+        """
+        Waits for the go_homes sent at STOP and stops the server, unless a new episode started meanwhile
+        :param episode: the episode being stopped
+        """
+        progress = EpisodeProgress(node='action_server', command=StartStopEpisodeRequest.STOP, phase='homing')
+        progress.header.stamp = rospy.Time.now()
+        self.episode_progress.publish(progress)
+        try:
             self.clients['left'].wait_for_result()
             self.clients['right'].wait_for_result()
-            rospy.set_param('/thr/action_server/stopped', True)
-        return StartStopEpisodeResponse()
+            if episode == self.episode:
+                rospy.set_param('/thr/action_server/stopped', True)
+        except Exception as e:
+            progress.error = "{}: {}".format(type(e).__name__, e)
+            rospy.logerr("Homing failed: {}".format(progress.error))
+            raise
+        finally:
+            # The interaction controller waits for this message before starting the next episode
+            progress.finished = True
+            progress.header.stamp = rospy.Time.now()
+            self.episode_progress.publish(progress)
+
+    def cb_goal(self, goal_handle):
+        """
+        Accepts a Decision sent by a client. Decisions always succeed immediately, unless they are not mapped to robot actions
+        :param goal_handle: handle of the RunDecisionGoal
+        """
+        if rospy.get_param('/thr/action_server/stopped'):
+            rospy.logwarn("Decision server stopped, ignoring goal sent without force mode")
+            goal_handle.set_rejected()
+            return
+        goal_handle.set_accepted()
+        if self.execute(goal_handle.get_goal()):
+            goal_handle.set_succeeded()
+        else:
+            goal_handle.set_aborted()
 
     def execute(self, decision_goal, force=False):
         """
-        Execute a goal if the server is started or if force mode is enabled
+        Converts a Decision into a robot action and dispatches it to the queue of the capable arm
         :param decision_goal: The Decision to execute
-        :param force: True when execution must be forced, e.g. this is an internal goal not coming from a client
+        :param force: True when execution must be forced, e.g. this is an internal goal not coming from a client, it always preempts
+        :return: False if no arm is capable of this decision
         """
-        if force or not rospy.get_param('/thr/action_server/stopped'):
-            robot_goal = RunRobotActionGoal()
-            try:
-                robot_goal.action.type = self.mapping[decision_goal.decision.type]['type']
-                client = self.mapping[decision_goal.decision.type]['client']
-            except KeyError as k:
-                rospy.logerr("No client is capable of action {}{}: KeyError={}".format(decision_goal.decision.type, str(decision_goal.decision.parameters), k.message))
-                if not force:  # Decision goals sent by clients fail only if they are not mapped to robot actions
-                    self.server.set_aborted()
+        decision = decision_goal.decision
+        if not decision.trace_id:
+            decision.trace_id = self.tracer.new_id()  # Decision from a client that does not trace
+        self.tracer.hop(decision.trace_id, 'decision_received', decision.type, decision.parameters)
+        robot_goal = RunRobotActionGoal()
+        robot_goal.action.trace_id = decision.trace_id
+        try:
+            client, robot_goal.action.type = self.model.decisions[decision_goal.decision.type]
+        except KeyError as k:
+            rospy.logerr("No client is capable of action {}{}: KeyError={}".format(decision_goal.decision.type, str(decision_goal.decision.parameters), k.message))
+            return False
+
+        with self.lock:
+            robot_goal.action.id = self.sequence
+            self.sequence += 1
+            robot_goal.action.parameters = decision_goal.decision.parameters
+            policy = 'preempt' if force else self.policies[client]
+            self.refresh(client)  # The arm may have ended its action since the last update_status
+            if self.current_actions[client] is None:
+                self.send_goal(client, robot_goal)
+            elif policy == 'preempt':
+                self.queues[client].clear()
+                self.publish_event(client, self.current_actions[client], ActionHistoryEvent.FINISHED_FAILURE)
+                self.send_goal(client, robot_goal)
+            elif policy == 'queue':
+                if len(self.queues[client]) >= self.max_queue:
+                    dropped = self.queues[client].popleft()
+                    rospy.logwarn("Queue of arm {} is full, dropping {}{}".format(client, dropped.action.type, str(dropped.action.parameters)))
+                self.queues[client].append(robot_goal)
             else:
-                robot_goal.action.id = self.sequence
-                robot_goal.action.parameters = decision_goal.decision.parameters
-                self.clients[client].send_goal(robot_goal)
-                self.current_actions[client] = robot_goal.action
-
-                # Publish the event to the action history topic
-                event = ActionHistoryEvent()
-                event.header.stamp = rospy.Time.now()
-                event.type = ActionHistoryEvent.STARTING
-                event.action = robot_goal.action
-                event.side = client
-                self.action_history.publish(event)
-
-                if not force:  # Decision goals sent by clients always succeed otherwise
-                    self.server.set_succeeded()
-        else:
-            rospy.logwarn("Decision server stopped, ignoring goal sent without force mode")
+                rospy.logwarn("Arm {} is busy, ignoring {}{}".format(client, robot_goal.action.type, str(robot_goal.action.parameters)))
+        return True
 
-    def should_interrupt(self):
+    def send_goal(self, side, robot_goal):
         """
-        :return: True if motion should interrupts at that time for whatever reason
+        Sends a robot action to an arm, must be called with self.lock acquired
         """
-        return rospy.is_shutdown() or self.server.is_preempt_requested()
+        self.clients[side].send_goal(robot_goal)
+        self.tracer.hop(robot_goal.action.trace_id, 'robot_goal_sent', robot_goal.action.type, robot_goal.action.parameters)
+        self.current_actions[side] = robot_goal.action
+        self.publish_event(side, robot_goal.action, ActionHistoryEvent.STARTING)
+
+    def publish_event(self, side, action, type):
+        # Publish the event to the action history topic
+        event = ActionHistoryEvent()
+        event.header.stamp = rospy.Time.now()
+        event.type = type
+        event.action = action
+        event.side = side
+        self.action_history.publish(event)
+        if type != ActionHistoryEvent.STARTING:
+            self.tracer.hop(action.trace_id, 'history_finished', action.type, action.parameters)
+
+    def refresh(self, side):
+        """
+        Gets the status of the action client of an arm, publishes its action if it ended and dispatches the next queued one,
+        must be called with self.lock acquired
+        """
+        action = self.current_actions[side]
+        if action: # If an action is running for this arm...
+            state = self.clients[side].get_state()
+            if state not in [GoalStatus.PENDING, GoalStatus.ACTIVE]: # ... and the action server reports it's ended...
+                self.publish_event(side, action, ActionHistoryEvent.FINISHED_SUCCESS if state == GoalStatus.SUCCEEDED else ActionHistoryEvent.FINISHED_FAILURE)
+                self.current_actions[side] = None
+                if len(self.queues[side]) > 0:
+                    self.send_goal(side, self.queues[side].popleft())
 
     def update_status(self):
         """
-        This method gets the status of the children action clients and update the Decision server according to them.
+        This method gets the status of the children action clients, publishes the ended actions and dispatches the next queued ones
         :return:
         """
-        for side, action in self.current_actions.iteritems():
-            if action: # If an action is running for this arm...
-                robot_state = self.clients[side].get_state()
-                if robot_state not in [GoalStatus.PENDING, GoalStatus.ACTIVE]: # ... and the action server reports it's ended...
-                    state = self.clients[side].get_state()
-                    # Publish the event to the action history topic
-                    event = ActionHistoryEvent()
-                    event.header.stamp = rospy.Time.now()
-                    event.type = ActionHistoryEvent.FINISHED_SUCCESS if state == GoalStatus.SUCCEEDED else ActionHistoryEvent.FINISHED_FAILURE
-                    event.action = action
-                    event.side = side
-                    self.action_history.publish(event)
-                    self.current_actions[side] = None
+        with self.lock:
+            for side in self.current_actions:
+                self.refresh(side)
 
     def start(self):
+        self.server.start()
         while not rospy.is_shutdown():
             self.update_status()
             rospy.sleep(self.action_params['sleep_step'])
@@ -6,9 +6,11 @@ import tf
 import sys
 import actionlib
 import transformations
-from thr_actions import Give, GoHome, Hold, Pick, Grasp, Bring, Place
+from thr_actions import Give, GoHome, Hold, Pick, Grasp, Bring, Place, Prefetch
 from baxter_commander import ArmCommander
-from thr_infrastructure_msgs.msg import RunRobotActionAction, RunRobotActionActionResult
+from thr_infrastructure_msgs.msg import RunRobotActionAction, RunRobotActionActionResult, ActionMetrics
+from thr_scenes import SceneModel
+from thr_action_server import Tracer
 from time import time
 
 class RobotActionServer:
@@ -29,14 +31,12 @@ class RobotActionServer:
         self.tfl = tf.TransformListener(True, rospy.Duration(5*60)) # TF Interpolation ON and duration of its cache = 5 minutes
         self.world = "base"
         self.scene = rospy.get_param("/thr/scene")
-        with open(self.rospack.get_path("thr_scenes")+"/config/"+self.scene+"/poses.json") as f:
-            self.poses = json.load(f)
+        self.model = SceneModel.load(self.scene, rospy.get_param('/thr/objects')[self.scene], self.rospack)
+        self.poses = self.model.poses
         with open(self.rospack.get_path("thr_action_server")+"/config/action_params.json") as f:
             self.action_params = json.load(f)
         with open(self.rospack.get_path("thr_action_server")+"/config/seeds.json") as f:
             self.seeds = json.load(f)
-        with open(self.rospack.get_path("thr_action_server")+"/config/abilities.json") as f:
-            self.abilities = json.load(f)
 
         # Motion/Grasping attributes
         self.commander = ArmCommander(side, default_kv_max=self.action_params['limits']['kv'], default_ka_max=self.action_params['limits']['ka'], ik='robot', fk='kdl')
@@ -58,14 +58,20 @@ class RobotActionServer:
         rospy.loginfo("Starting server "+side)
         self.server = actionlib.SimpleActionServer('/thr/robot_run_action/'+side, RunRobotActionAction, self.execute, False)
         self.result = RunRobotActionActionResult()
+        self.metrics_pub = rospy.Publisher('/thr/action_metrics', ActionMetrics, queue_size=10)
+        self.tracer = Tracer('robot_action_server_'+side)
+
+        # Approaches of the next predicted actions of this arm are computed in advance
+        self.prefetch = Prefetch(self.side, self.model, self.action_params,
+                                 lambda type, object, pose_id: self.actions[type]._compute_approach(type, object, pose_id))
 
         # Actual actions
         self.actions = {
             'give': Give(self.commander, self.tfl, self.action_params, self.poses, self.seeds, self.server.is_preempt_requested),
             'go_home_'+self.side: GoHome(self.commander, self.tfl, self.action_params, self.poses, self.seeds, self.server.is_preempt_requested),
-            'hold': Hold(self.commander, self.tfl, self.action_params, self.poses, self.seeds, self.server.is_preempt_requested),
-            'pick': Pick(self.commander, self.tfl, self.action_params, self.poses, self.seeds, self.server.is_preempt_requested),
-            'grasp': Grasp(self.commander, self.tfl, self.action_params, self.poses, self.seeds, self.server.is_preempt_requested),
+            'hold': Hold(self.commander, self.tfl, self.action_params, self.poses, self.seeds, self.server.is_preempt_requested, self.prefetch),
+            'pick': Pick(self.commander, self.tfl, self.action_params, self.poses, self.seeds, self.server.is_preempt_requested, self.prefetch),
+            'grasp': Grasp(self.commander, self.tfl, self.action_params, self.poses, self.seeds, self.server.is_preempt_requested, self.prefetch),
             'bring_'+self.side: Bring(self.commander, self.tfl, self.action_params, self.poses, self.seeds, self.server.is_preempt_requested),
             'place_'+self.side: Place(self.commander, self.tfl, self.action_params, self.poses, self.seeds, self.server.is_preempt_requested),
             }
@@ -80,14 +86,24 @@ class RobotActionServer:
         :param goal:
         """
         try:
-            assert self.abilities[goal.action.type] == self.side
+            assert self.model.sides[goal.action.type] == self.side
             decision = self.actions[goal.action.type]
         except KeyError or AssertionError:
             rospy.logwarn('{} arm is not capable of decision {}'.format(self.side, goal.action.type))
             self.server.set_aborted()
         else:
             # Note: do not try/catch: an Exception ends up in an aborted state, ... perfect!
-            if decision.run(goal.action.parameters):
+            success = False
+            decision.metrics.start()
+            self.tracer.hop(goal.action.trace_id, 'robot_started', goal.action.type, goal.action.parameters)
+            try:
+                success = decision.run(goal.action.parameters)
+            finally:
+                self.tracer.hop(goal.action.trace_id, 'robot_finished', goal.action.type, goal.action.parameters)
+                metrics = decision.metrics.to_msg(goal.action, self.side, bool(success))
+                metrics.header.stamp = rospy.Time.now()
+                self.metrics_pub.publish(metrics)
+            if success:
                 self.server.set_succeeded()
             else:
                 self.server.set_aborted()
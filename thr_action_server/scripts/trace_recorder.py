@@ -0,0 +1,28 @@
+#! /usr/bin/env python
+import os
+import json
+import rospy
+import rospkg
+from thr_infrastructure_msgs.msg import TraceEvent
+
+
+class TraceRecorder(object):
+    """
+    Appends the hops published on /thr/trace to a JSON lines file, to be analysed with trace_report.py
+    """
+    def __init__(self, output):
+        self.output = open(output, 'a')
+        rospy.Subscriber('/thr/trace', TraceEvent, self.cb_trace, queue_size=1000)
+        rospy.on_shutdown(self.output.close)
+        rospy.loginfo("[TraceRecorder] Recording traces in {}".format(output))
+
+    def cb_trace(self, msg):
+        self.output.write(json.dumps({'trace_id': msg.trace_id, 'stamp': msg.header.stamp.to_sec(), 'node': msg.node,
+                                      'hop': msg.hop, 'type': msg.type, 'parameters': list(msg.parameters)}) + '\n')
+        self.output.flush()
+
+
+if __name__ == '__main__':
+    rospy.init_node('trace_recorder')
+    TraceRecorder(rospy.get_param('~output', os.path.join(rospkg.get_ros_home(), 'thr_traces.jsonl')))
+    rospy.spin()
@@ -0,0 +1,76 @@
+#! /usr/bin/env python
+"""
+Reconstructs the timelines of decisions recorded by trace_recorder.py and prints the latency breakdown per hop.
+Usage: trace_report.py [traces.jsonl] [--trace TRACE_ID]
+"""
+import os
+import sys
+import json
+import argparse
+from collections import OrderedDict
+from thr_action_server import HOPS
+
+
+def load_timelines(path):
+    """
+    :return: OrderedDict trace_id -> list of hops sorted by time
+    """
+    timelines = OrderedDict()
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                hop = json.loads(line)
+                timelines.setdefault(hop['trace_id'], []).append(hop)
+    for hops in timelines.values():
+        hops.sort(key=lambda hop: hop['stamp'])
+    return timelines
+
+
+def breakdown(timelines):
+    """
+    :return: OrderedDict (from hop, to hop) -> list of latencies in seconds, between consecutive hops of the pipeline
+    """
+    latencies = OrderedDict(((HOPS[i], HOPS[i+1]), []) for i in range(len(HOPS)-1))
+    latencies[('predicted', 'robot_started')] = []  # Reaction time of the robot
+    for hops in timelines.values():
+        stamps = dict((hop['hop'], hop['stamp']) for hop in hops)  # Last occurrence of each hop
+        for (start, end), values in latencies.items():
+            if start in stamps and end in stamps:
+                values.append(stamps[end] - stamps[start])
+    return latencies
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values)-1, int(p*len(values)))]
+
+
+def print_timeline(hops):
+    start = hops[0]['stamp']
+    for hop in hops:
+        print("{:>10.3f}s  {:<18} {:<28} {}{}".format(hop['stamp'] - start, hop['hop'], hop['node'], hop['type'], hop['parameters']))
+
+
+def print_breakdown(latencies):
+    print("{:<40} {:>6} {:>9} {:>9} {:>9} {:>9}".format("hop", "count", "mean", "median", "p90", "max"))
+    for (start, end), values in latencies.items():
+        if len(values) > 0:
+            print("{:<40} {:>6} {:>8.3f}s {:>8.3f}s {:>8.3f}s {:>8.3f}s".format(
+                  start + " -> " + end, len(values), sum(values)/len(values),
+                  percentile(values, 0.5), percentile(values, 0.9), max(values)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Latency breakdown of the decisions recorded by trace_recorder.py')
+    parser.add_argument('traces', nargs='?', default=os.path.join(os.environ.get('ROS_HOME', os.path.expanduser('~/.ros')), 'thr_traces.jsonl'))
+    parser.add_argument('--trace', help='print the timeline of this trace id only')
+    args = parser.parse_args()
+
+    timelines = load_timelines(args.traces)
+    if args.trace:
+        if args.trace not in timelines:
+            sys.exit("No trace {} in {}".format(args.trace, args.traces))
+        print_timeline(timelines[args.trace])
+    else:
+        print("{} decisions traced in {}".format(len(timelines), args.traces))
+        print_breakdown(breakdown(timelines))
@@ -2,6 +2,6 @@
 from distutils.core import setup
 from catkin_pkg.python_setup import generate_distutils_setup
 d = generate_distutils_setup()
-d['packages'] = ['thr_actions']
+d['packages'] = ['thr_actions', 'thr_action_server']
 d['package_dir'] = {'': 'src'}
 setup(**d)
@@ -0,0 +1,3 @@
+from . history import ActionHistory, fetch_history
+from . metrics import Histogram, MetricsAggregator
+from . trace import Tracer, HOPS
@@ -0,0 +1,105 @@
+import rospy
+from collections import deque, OrderedDict
+from itertools import islice
+from thr_infrastructure_msgs.msg import ActionHistoryEvent, ActionDurationStats
+from thr_infrastructure_msgs.srv import GetActionHistory, GetActionHistoryRequest
+
+
+class ActionHistory(object):
+    """
+    Bounded in-memory history of ActionHistoryEvents, indexed by action id, side and action type.
+    The oldest events are dropped when the ring is full, all indexes stay in insertion order so that dropping is O(1).
+    Running actions and duration statistics are maintained at insertion, they do not depend on the ring size.
+    """
+    def __init__(self, size=1000):
+        self.events = deque(maxlen=size)
+        self.by_id = {}              # action id -> deque of events of this action
+        self.by_side = {}            # side -> deque of events
+        self.by_type = {}            # action type -> deque of events
+        self.running = OrderedDict()  # side -> STARTING event of the running action, the most recently started last
+        self.stats = {}              # action type -> [count, successes, total duration, min, max]
+
+    def _index(self, index, key, event):
+        index.setdefault(key, deque()).append(event)
+
+    def _unindex(self, index, key):
+        events = index[key]
+        events.popleft()  # The dropped event is always the oldest of all its indexes
+        if len(events) == 0:
+            del index[key]
+
+    def add(self, event):
+        if len(self.events) == self.events.maxlen:
+            oldest = self.events[0]
+            self._unindex(self.by_id, oldest.action.id)
+            self._unindex(self.by_side, oldest.side)
+            self._unindex(self.by_type, oldest.action.type)
+        self.events.append(event)
+        self._index(self.by_id, event.action.id, event)
+        self._index(self.by_side, event.side, event)
+        self._index(self.by_type, event.action.type, event)
+
+        if event.type == ActionHistoryEvent.STARTING:
+            self.running.pop(event.side, None)
+            self.running[event.side] = event
+        else:
+            started = self.running.get(event.side)
+            if started is not None and started.action.id == event.action.id:
+                del self.running[event.side]
+                duration = (event.header.stamp - started.header.stamp).to_sec()
+                stats = self.stats.setdefault(event.action.type, [0, 0, 0., float('inf'), 0.])
+                stats[0] += 1
+                stats[1] += 1 if event.type == ActionHistoryEvent.FINISHED_SUCCESS else 0
+                stats[2] += duration
+                stats[3] = min(stats[3], duration)
+                stats[4] = max(stats[4], duration)
+
+    def last(self, n, side='', type=''):
+        """
+        :param n: maximum number of events to return
+        :param side: if not empty, only events of this side
+        :param type: if not empty, only events of this action type
+        :return: the n most recent events matching, oldest first
+        """
+        if side and type:
+            events = [event for event in reversed(self.by_side.get(side, ())) if event.action.type == type]
+        elif side:
+            events = reversed(self.by_side.get(side, ()))
+        elif type:
+            events = reversed(self.by_type.get(type, ()))
+        else:
+            events = reversed(self.events)
+        return list(islice(events, n))[::-1]
+
+    def of_action(self, id):
+        """
+        :return: the events of an action id still in the ring, oldest first
+        """
+        return list(self.by_id.get(id, ()))
+
+    def last_running(self):
+        """
+        :return: the STARTING event of the most recently started action still running, or None
+        """
+        return next(reversed(self.running.values()), None)
+
+    def duration_stats(self):
+        return [ActionDurationStats(type=type, count=count, successes=successes, mean=total/count, min=min, max=max)
+                for type, (count, successes, total, min, max) in sorted(self.stats.items())]
+
+
+def fetch_history(size=1000, service='/thr/get_action_history', timeout=1.):
+    """
+    Builds an ActionHistory from the action history server so that a late joiner catches up with the running actions
+    :return: an ActionHistory, empty if the server is not available
+    """
+    history = ActionHistory(size)
+    try:
+        rospy.wait_for_service(service, timeout)
+        reply = rospy.ServiceProxy(service, GetActionHistory).call(GetActionHistoryRequest(last=size))
+    except (rospy.ROSException, rospy.ServiceException) as e:
+        rospy.logwarn("Cannot fetch the action history from {}: {}".format(service, e))
+    else:
+        for event in reply.events:
+            history.add(event)
+    return history
@@ -0,0 +1,61 @@
+from bisect import bisect_right
+
+
+class Histogram(object):
+    """
+    Histogram of values over fixed bin edges, counts[i] is the number of values in [edges[i-1], edges[i])
+    """
+    def __init__(self, edges):
+        self.edges = list(edges)
+        self.counts = [0]*(len(self.edges) + 1)
+        self.num = 0
+        self.total = 0.
+        self.max = 0.
+
+    def add(self, value):
+        self.counts[bisect_right(self.edges, value)] += 1
+        self.num += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def to_dict(self):
+        return {'edges': self.edges, 'counts': self.counts, 'num': self.num, 'max': self.max,
+                'mean': self.total/self.num if self.num > 0 else 0.}
+
+
+class MetricsAggregator(object):
+    """
+    Aggregates ActionMetrics into histograms per action type: one per phase, one for the total and one per retry counter
+    """
+    def __init__(self, edges, count_edges=(1, 2, 3, 5, 10)):
+        """
+        :param edges: bin edges of the duration histograms, in seconds
+        :param count_edges: bin edges of the retry counter histograms
+        """
+        self.edges = edges
+        self.count_edges = count_edges
+        self.actions = {}  # action type -> {'num': n, 'successes': n, 'total': Histogram, 'phases': {}, 'counters': {}}
+
+    def add(self, metrics):
+        action = self.actions.setdefault(metrics.action.type, {'num': 0, 'successes': 0, 'total': Histogram(self.edges),
+                                                               'phases': {}, 'counters': {}})
+        action['num'] += 1
+        action['successes'] += 1 if metrics.success else 0
+        action['total'].add(metrics.total)
+        for phase, duration in zip(metrics.phases, metrics.durations):
+            action['phases'].setdefault(phase, Histogram(self.edges)).add(duration)
+        for counter, count in zip(metrics.counters, metrics.counts):
+            action['counters'].setdefault(counter, Histogram(self.count_edges)).add(count)
+
+    def to_dict(self):
+        return dict((type, {'num': action['num'], 'successes': action['successes'], 'total': action['total'].to_dict(),
+                            'phases': dict((phase, h.to_dict()) for phase, h in action['phases'].items()),
+                            'counters': dict((counter, h.to_dict()) for counter, h in action['counters'].items())})
+                    for type, action in self.actions.items())
+
+    def slowest_phases(self):
+        """
+        :return: list of (mean duration, action type, phase) sorted from the slowest
+        """
+        return sorted(((h.total/h.num, type, phase) for type, action in self.actions.items()
+                       for phase, h in action['phases'].items() if h.num > 0), reverse=True)
@@ -0,0 +1,49 @@
+import rospy
+import uuid
+from collections import OrderedDict
+from thr_infrastructure_msgs.msg import TraceEvent
+
+# Hops of a decision through the pipeline, in order
+HOPS = ['predicted', 'dispatched', 'decision_received', 'robot_goal_sent', 'robot_started', 'robot_finished', 'history_finished']
+
+
+class Tracer(object):
+    """
+    Records the hops of decisions on /thr/trace, correlated by the trace_id of their Decision/RobotAction
+    """
+    def __init__(self, node, topic='/thr/trace', max_pending=1000):
+        self.node = node
+        self.publisher = rospy.Publisher(topic, TraceEvent, queue_size=100)
+        self.max_pending = max_pending
+        self.predictions = OrderedDict()  # trace_id -> time of the predictor reply, for predicted decisions not dispatched yet
+
+    @staticmethod
+    def new_id():
+        return uuid.uuid4().hex
+
+    def hop(self, trace_id, hop, type='', parameters=(), stamp=None):
+        event = TraceEvent(trace_id=trace_id, node=self.node, hop=hop, type=type, parameters=list(parameters))
+        event.header.stamp = rospy.Time.now() if stamp is None else stamp
+        self.publisher.publish(event)
+
+    def predicted(self, decisions):
+        """
+        Gives a trace id to the decisions returned by the predictor. The 'predicted' hop is recorded only if they are dispatched
+        """
+        stamp = rospy.Time.now()
+        for decision in decisions:
+            decision.trace_id = self.new_id()
+            self.predictions[decision.trace_id] = stamp
+            if len(self.predictions) > self.max_pending:
+                self.predictions.popitem(last=False)
+
+    def dispatched(self, decision):
+        """
+        Records the dispatch of a decision to the decision server, giving it a trace id if it has none (e.g. decision from the human)
+        """
+        if not decision.trace_id:
+            decision.trace_id = self.new_id()
+        predicted = self.predictions.pop(decision.trace_id, None)
+        if predicted is not None:
+            self.hop(decision.trace_id, 'predicted', decision.type, decision.parameters, predicted)
+        self.hop(decision.trace_id, 'dispatched', decision.type, decision.parameters)
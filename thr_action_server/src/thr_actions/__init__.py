@@ -4,4 +4,5 @@ from . bring import Bring
 from . go_home import GoHome
 from . hold import Hold
 from . pick import Pick
-from . place import Place
\ No newline at end of file
+from . place import Place
+from . prefetch import Prefetch
\ No newline at end of file
@@ -1,15 +1,21 @@
 import transformations
 from rospy import is_shutdown, get_param
+from baxter_commander.persistence import dicttostate
+from . prefetch import APPROACH_SEEDS
+from . metrics import Metrics, Timed, COMMANDER_PHASES, TF_PHASES
 
 class Action(object):
     """
     Abstract class representing an executable action
     """
-    def __init__(self, commander, tf_listener, action_params, poses, seeds, should_interrupt=None):
+    def __init__(self, commander, tf_listener, action_params, poses, seeds, should_interrupt=None, prefetch=None):
         self.__should_interrupt = should_interrupt
+        self.prefetch = prefetch
         self.world = "base"
-        self.commander = commander
-        self.tfl = tf_listener
+        self.metrics = Metrics()
+        # Calls to the commander and TF are timed as phases of the action
+        self.commander = Timed(commander, self.metrics, COMMANDER_PHASES)
+        self.tfl = Timed(tf_listener, self.metrics, TF_PHASES)
         self.action_params = action_params
         self.poses = poses
         self.seeds = seeds
@@ -33,6 +39,42 @@ class Action(object):
         world_pose = self.tfl.transformPose(self.world, obj_pose)
         return world_pose
 
+    def _compute_approach(self, type, object, pose_id=0):
+        """
+        Computes the approach pose of a grasping action and the IK reaching it
+        :param type: the action type owning the approach pose in poses.json (pick, hold, grasp)
+        :return: (world approach pose, IK or None if unreachable)
+        """
+        world_approach_pose = self._object_grasp_pose_to_world(self.poses[object][type][pose_id]['approach'], object)
+        seed = APPROACH_SEEDS[type]
+        if seed is None:
+            return world_approach_pose, self.commander.get_ik(world_approach_pose)
+        return world_approach_pose, self.commander.get_ik(world_approach_pose, dicttostate(self.seeds[seed]))
+
+    def _approach(self, type, object, pose_id=0):
+        """
+        Same as _compute_approach() but the IK is taken from the prefetch if it has been computed in advance and the object did not move
+        """
+        if self.prefetch is None:
+            return self._compute_approach(type, object, pose_id)
+        world_approach_pose = self._object_grasp_pose_to_world(self.poses[object][type][pose_id]['approach'], object)
+        goal_approach = self.prefetch.get(type, object, pose_id, world_approach_pose)
+        if goal_approach:
+            return world_approach_pose, goal_approach
+        return self._compute_approach(type, object, pose_id)
+
+    def _phase(self, name):
+        """
+        Context manager timing a phase of the action that is not timed automatically, e.g. waiting for the human
+        """
+        return self.metrics.phase(name)
+
+    def _retry(self, name):
+        """
+        Counts a new attempt of a retry loop
+        """
+        self.metrics.count(name)
+
     def _should_interrupt(self):
         """
         :return: True if motion should interrupts at that time for whatever reason
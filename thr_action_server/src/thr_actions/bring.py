@@ -19,6 +19,7 @@ class Bring(Action):
 
         rospy.loginfo("Bringing {} to the human".format(object))
         while not self._should_interrupt():
+            self._retry('bring')
             try:
                 distance_object_location = transformations.distance(self.tfl.lookupTransform(wrist, object, rospy.Time(0)), self.poses[object]['bring'][wrist])
                 object_T_gripper = self.tfl.lookupTransform(object, self.gripper_name, rospy.Time(0))
@@ -1,12 +1,11 @@
 from . action import Action
-from baxter_commander.persistence import dicttostate
 import rospy
 import transformations
 import numpy as np
 
 class Grasp(Action):
-    def __init__(self, commander, tf_listener, action_params, poses, seeds, should_interrupt=None):
-        super(Grasp, self).__init__(commander, tf_listener, action_params, poses, seeds, should_interrupt)
+    def __init__(self, commander, tf_listener, action_params, poses, seeds, should_interrupt=None, prefetch=None):
+        super(Grasp, self).__init__(commander, tf_listener, action_params, poses, seeds, should_interrupt, prefetch)
         self.gripper = commander.name+'_gripper'
 
     def run(self, parameters=None):
@@ -20,13 +19,13 @@ class Grasp(Action):
         cart_dist = float('inf')
         angular_dist = float('inf')
         while cart_dist > self.action_params['grasp']['approach_cartesian_dist'] or angular_dist>self.action_params['grasp']['approach_angular_dist']:
+            self._retry('approach')
             try:
-                world_approach_pose = self._object_grasp_pose_to_world(self.poses[object]["grasp"][pose]['approach'], object)  # Pose of the approach
+                world_approach_pose, goal_approach = self._approach('grasp', object, pose)  # Pose of the approach, no seed provided
             except:
                 rospy.logerr("Object {} not found".format(object))
                 return False
 
-            goal_approach = self.commander.get_ik(world_approach_pose) #, dicttostate(self.seeds['grasp'])) # No seed provided
             if not goal_approach:
                 rospy.logerr("Unable to reach approach pose")
                 return False
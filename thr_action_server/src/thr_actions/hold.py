@@ -1,7 +1,7 @@
 from . action import Action
-from baxter_commander.persistence import dicttostate
 from baxter_core_msgs.msg import DigitalIOState
-from thr_infrastructure_msgs.srv import GetSceneStateRequest, GetSceneState
+from thr_infrastructure_msgs.msg import CompactSceneState, PredicateSchema
+from thr_scenes import PredicateSchema as Schema
 from numpy import array
 import rospy
 import numpy as np
@@ -9,27 +9,36 @@ import transformations
 
 
 class Hold(Action):
-    def __init__(self, commander, tf_listener, action_params, poses, seeds, should_interrupt=None):
-        super(Hold, self).__init__(commander, tf_listener, action_params, poses, seeds, should_interrupt)
+    def __init__(self, commander, tf_listener, action_params, poses, seeds, should_interrupt=None, prefetch=None):
+        super(Hold, self).__init__(commander, tf_listener, action_params, poses, seeds, should_interrupt, prefetch)
         self.gripper = commander.name+'_gripper'
-        self.scene = None
-        self.scene_state_service = '/thr/scene_state'
+        self.scene = None   # Last compact scene state
+        self.schema = None
         self.stop_pressed = False  # True if the HOLD STOP button has been pressed (Baxter BACK buttons on limbs)
 
         rospy.Subscriber("/robot/digital_io/left_button_back/state", DigitalIOState, self.cb_digital_io)
         rospy.Subscriber("/robot/digital_io/right_button_back/state", DigitalIOState, self.cb_digital_io)
+        rospy.Subscriber('/thr/predicate_schema', PredicateSchema, self.cb_schema)
+        rospy.Subscriber('/thr/compact_scene_state', CompactSceneState, self.cb_scene_state)
 
     def cb_digital_io(self, msg):
         if msg.state == DigitalIOState.PRESSED:
             self.stop_pressed = True
 
-    def update_scene(self):
-        request = GetSceneStateRequest()
-        try:
-            getscene = rospy.ServiceProxy(self.scene_state_service, GetSceneState)
-            self.scene = getscene(request).state
-        except rospy.ServiceException as e:
-            rospy.logerr("Cannot update scene {}:".format(e.message))
+    def cb_schema(self, msg):
+        self.schema = Schema.from_msg(msg)
+
+    def cb_scene_state(self, msg):
+        self.scene = msg
+
+    def is_attached(self, object, pose):
+        """
+        :return: True if the scene state received last contains ATTACHED(object, *, pose)
+        """
+        scene, schema = self.scene, self.schema
+        if scene is None or schema is None or scene.schema_revision != schema.revision:
+            return False
+        return schema.match(scene, 'attached', [object, None, pose])
 
     def run(self, parameters=None):
         # Parameters could be "/thr/handle 0", it asks the robot to hold the handle using its first hold pose
@@ -43,13 +52,13 @@ class Hold(Action):
         angular_dist = float('inf')
         # While the approach pose continues to change (because the object moved
         while cart_dist > self.action_params['hold']['approach_cartesian_dist'] or angular_dist>self.action_params['hold']['approach_angular_dist']:
+            self._retry('approach')
             try:
-                world_approach_pose = self._object_grasp_pose_to_world(self.poses[object]["hold"][pose]['approach'], object)  # Pose of the approach
+                world_approach_pose, goal_approach = self._approach('hold', object, pose)  # Pose of the approach
             except:
                 rospy.logerr("Object {} not found".format(object))
                 return False
 
-            goal_approach = self.commander.get_ik(world_approach_pose, dicttostate(self.seeds['hold']))
             if not goal_approach:
                 rospy.logerr("Unable to reach approach pose")
                 return False
@@ -99,13 +108,13 @@ class Hold(Action):
             return False
 
         # 5. Wait for interruption
-        while not self._should_interrupt():
-            self.update_scene()
-            attached = len([pred for pred in self.scene.predicates if pred.type == 'attached' and pred.parameters[0] == object and int(pred.parameters[2]) == pose]) > 0
-            if attached or self.stop_pressed:
-                self.stop_pressed = False
-                break
-            rospy.sleep(self.action_params['sleep_step'])
+        with self._phase('human'):
+            while not self._should_interrupt():
+                attached = self.is_attached(object, pose)
+                if attached or self.stop_pressed:
+                    self.stop_pressed = False
+                    break
+                rospy.sleep(self.action_params['sleep_step'])
 
         # 6. Release object
         rospy.loginfo("Releasing {}".format(object))
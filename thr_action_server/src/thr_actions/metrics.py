@@ -0,0 +1,83 @@
+from collections import OrderedDict
+from contextlib import contextmanager
+from threading import current_thread
+from time import time
+from thr_infrastructure_msgs.msg import ActionMetrics
+
+# Methods of the commander and of the TF listener timed automatically, and the phase they belong to
+COMMANDER_PHASES = {'get_ik': 'ik', 'move_to_controlled': 'motion', 'translate_to_cartesian': 'motion',
+                    'open': 'gripper', 'close': 'gripper', 'wait_for_human_grasp': 'human'}
+TF_PHASES = {'lookupTransform': 'tf', 'transformPose': 'tf', 'waitForTransform': 'tf'}
+
+
+class Metrics(object):
+    """
+    Wall time spent in each phase of an action (tf, ik, motion, gripper, human...) and retry counters.
+    Only the thread that started the recording is measured (e.g. not the prefetch computing IKs in background),
+    and nested phases are accounted to the outermost one.
+    """
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.durations = OrderedDict()  # phase -> total wall time
+        self.calls = OrderedDict()      # phase -> number of times it has been entered
+        self.counters = OrderedDict()   # counter -> count
+        self.thread = None
+        self.depth = 0
+        self.start_time = None
+
+    def start(self):
+        self.reset()
+        self.thread = current_thread()
+        self.start_time = time()
+
+    def recording(self):
+        return self.thread is current_thread()
+
+    @contextmanager
+    def phase(self, name):
+        if not self.recording() or self.depth > 0:
+            yield
+            return
+        self.depth += 1
+        start = time()
+        try:
+            yield
+        finally:
+            self.depth -= 1
+            self.durations[name] = self.durations.get(name, 0.) + time() - start
+            self.calls[name] = self.calls.get(name, 0) + 1
+
+    def count(self, name, n=1):
+        if self.recording():
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def to_msg(self, action, side, success):
+        msg = ActionMetrics(action=action, side=side, success=success,
+                            phases=list(self.durations), durations=list(self.durations.values()),
+                            calls=[self.calls[phase] for phase in self.durations],
+                            counters=list(self.counters), counts=list(self.counters.values()),
+                            total=time() - self.start_time if self.start_time is not None else 0.)
+        self.thread = None
+        return msg
+
+
+class Timed(object):
+    """
+    Proxy of an object (commander, TF listener) timing some of its methods as phases of a Metrics
+    """
+    def __init__(self, target, metrics, phases):
+        self._target = target
+        self._metrics = metrics
+        self._phases = phases
+
+    def __getattr__(self, name):
+        attribute = getattr(self._target, name)
+        if name not in self._phases or not callable(attribute):
+            return attribute
+
+        def timed(*args, **kwargs):
+            with self._metrics.phase(self._phases[name]):
+                return attribute(*args, **kwargs)
+        return timed
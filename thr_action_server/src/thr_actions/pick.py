@@ -1,13 +1,12 @@
 from . action import Action
-from baxter_commander.persistence import dicttostate
 from tf import LookupException
 from transformations import distance
 import rospy
 import numpy as np
 
 class Pick(Action):
-    def __init__(self, commander, tf_listener, action_params, poses, seeds, should_interrupt=None):
-        super(Pick, self).__init__(commander, tf_listener, action_params, poses, seeds, should_interrupt)
+    def __init__(self, commander, tf_listener, action_params, poses, seeds, should_interrupt=None, prefetch=None):
+        super(Pick, self).__init__(commander, tf_listener, action_params, poses, seeds, should_interrupt, prefetch)
         self.gripper = commander.name + '_gripper'
 
     def run(self, parameters=None):
@@ -16,17 +15,17 @@ class Pick(Action):
 
         # 1. Go to approach pose
         try:
-            world_approach_pose = self._object_grasp_pose_to_world(self.poses[object]["pick"][0]['approach'], object)
+            world_approach_pose, goal_approach = self._approach('pick', object)
         except LookupException:
             rospy.logerr("Object {} not found".format(object))
             return False
 
-        goal_approach = self.commander.get_ik(world_approach_pose, dicttostate(self.seeds['pick']))
         if not goal_approach:
             rospy.logerr("Unable to reach approach pose")
             return False
 
         while True:
+            self._retry('approach')
             if self._should_interrupt():
                 return False
             rospy.loginfo("Approaching {}".format(object))
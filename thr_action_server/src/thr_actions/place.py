@@ -40,6 +40,7 @@ class Place(Action):
                 rospy.logerr('Object {} is no longer gripped'.format(object))
                 return False
 
+            self._retry('via')
             if 'via' in self.poses[location]['place']:
                 rospy.loginfo("Approaching {} according to its viapoint".format(location))
                 location_T_object = self.poses[location]['place'][object]
@@ -66,6 +67,7 @@ class Place(Action):
                 rospy.logerr('Object {} is no longer gripped'.format(object))
                 return False
 
+            self._retry('place')
             try:
                 distance_object_location = transformations.distance(self.tfl.lookupTransform(location, object, rospy.Time(0)), self.poses[location]['place'][object])
             except:
@@ -0,0 +1,105 @@
+import rospy
+import transformations
+from threading import Thread, Condition, Lock
+from thr_infrastructure_msgs.msg import PredictedPlan
+
+# Robot actions starting with an approach pose + IK, and the seed they use for IK (None = no seed)
+APPROACH_SEEDS = {'pick': 'pick', 'hold': 'hold', 'grasp': None}
+
+
+class Prefetch(object):
+    """
+    Speculative computation of the approach poses and IKs of the next actions of an arm.
+    The predicted plan is read from /thr/predicted_plan and a background thread computes the approaches of the next
+    decisions mapped to this arm, so that the arm does not sit idle during the IK when the decision actually comes.
+    A prefetched approach is used only if the decision matches and the approach pose did not move beyond tolerance
+    since it has been computed (i.e. the object did not move), it is thrown away otherwise.
+    """
+    def __init__(self, side, model, action_params, compute):
+        """
+        :param side: arm of this action server
+        :param model: SceneModel of the scene, mapping decisions to arms
+        :param action_params: content of action_params.json
+        :param compute: callable(type, object, pose_id) returning (world_approach_pose, ik) or raising in case of failure
+        """
+        self.side = side
+        self.model = model
+        self.params = action_params['prefetch']
+        self.compute = compute
+        self.condition = Condition()
+        self.lock = Lock()
+        self.plan = None
+        self.cache = {}  # (type, object, pose_id) -> (computed time, world approach pose, ik)
+        self.hits = 0
+        self.misses = 0
+        rospy.Subscriber('/thr/predicted_plan', PredictedPlan, self.cb_predicted_plan, queue_size=1)
+        self.thread = Thread(target=self.run)
+        self.thread.setDaemon(True)
+        self.thread.start()
+
+    def cb_predicted_plan(self, msg):
+        with self.condition:
+            self.plan = msg
+            self.condition.notify()
+
+    def upcoming(self, plan):
+        """
+        :return: the keys (type, object, pose_id) of the next approaching actions of this arm in the plan
+        """
+        keys = []
+        for decision in plan.decisions:
+            client, type = self.model.decisions.get(decision.type, (None, None))
+            if client != self.side or type not in APPROACH_SEEDS or len(decision.parameters) == 0:
+                continue
+            pose_id = int(decision.parameters[1]) if type == 'hold' and len(decision.parameters) > 1 else 0
+            key = (type, decision.parameters[0], pose_id)
+            if key not in keys:
+                keys.append(key)
+            if len(keys) >= self.params['horizon']:
+                break
+        return keys
+
+    def run(self):
+        while not rospy.is_shutdown():
+            with self.condition:
+                while self.plan is None and not rospy.is_shutdown():
+                    self.condition.wait(1)
+                plan, self.plan = self.plan, None
+            if plan is None:
+                continue
+            keys = self.upcoming(plan)
+            with self.lock:
+                # Entries that are no longer predicted are thrown away
+                for key in [key for key in self.cache if key not in keys]:
+                    del self.cache[key]
+            for key in keys:
+                with self.lock:
+                    entry = self.cache.get(key)
+                if entry is not None and rospy.get_time() - entry[0] < self.params['max_age']:
+                    continue
+                try:
+                    approach, ik = self.compute(*key)
+                except Exception as e:
+                    rospy.logdebug("[Prefetch] Cannot prefetch {}{}: {}".format(key[0], str(key[1:]), e))
+                    continue
+                if ik:
+                    with self.lock:
+                        self.cache[key] = (rospy.get_time(), approach, ik)
+
+    def get(self, type, object, pose_id, world_approach_pose):
+        """
+        Consumes a prefetched IK if it is still valid
+        :param world_approach_pose: the approach pose just recomputed by the action (PoseStamped in world frame)
+        :return: the prefetched IK or None if there is no valid one
+        """
+        with self.lock:
+            entry = self.cache.pop((type, object, pose_id), None)
+        valid = entry is not None and rospy.get_time() - entry[0] < self.params['max_age'] and \
+            transformations.distance(entry[1], world_approach_pose) < self.params['approach_cartesian_dist'] and \
+            transformations.distance_quat(entry[1], world_approach_pose) < self.params['approach_angular_dist']
+        if valid:
+            self.hits += 1
+        else:
+            self.misses += 1
+        rospy.logdebug("[Prefetch] {} {}{}, {} hits / {} misses".format("Hit" if valid else "Miss", type, str([object, pose_id]), self.hits, self.misses))
+        return entry[2] if valid else None
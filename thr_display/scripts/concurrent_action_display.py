@@ -3,14 +3,21 @@
 import rospy, rospkg
 from thr_infrastructure_msgs.msg import ActionHistoryEvent
 from tf import LookupException
-import json, cv2, cv_bridge
+import cv2, cv_bridge
 from numpy import zeros, uint8
 from sensor_msgs.msg import Image
-from collections import deque
+from collections import deque, OrderedDict
 from baxter_commander import FaceCommander
+from thr_scenes import SceneModel
+from thr_action_server import fetch_history
 
 class ConcurrentActionDisplay(object):
-    def __init__(self, width, height, font=cv2.FONT_HERSHEY_SIMPLEX, scale=1, thickness=1, color=[255]*3, interline=1.1):
+    """
+    Displays the texts of display.json on the face screen when actions start or finish.
+    Rendered screens are kept as encoded Image messages in a LRU cache keyed by their lines, the entries of display.json
+    taking at most one parameter are prerendered at startup for all objects of the scene.
+    """
+    def __init__(self, width, height, font=cv2.FONT_HERSHEY_SIMPLEX, scale=1, thickness=1, color=[255]*3, interline=1.1, cache_size=64):
         self.face = FaceCommander()
         self.rospack = rospkg.RosPack()
         self.action_history_name = '/thr/action_history'
@@ -21,14 +28,19 @@ class ConcurrentActionDisplay(object):
         self.interline = interline
         self.queue = deque()
         self.width, self.height = width, height
-        self.events = []  # Current events are stored in this stack
+        self.history = fetch_history(100)  # Catch up with the actions already running
         self.scene = rospy.get_param('/thr/scene')
         self.image_pub = rospy.Publisher('/robot/xdisplay', Image, latch=True, queue_size=1)
+        self.bridge = cv_bridge.CvBridge()
+        self.frame = zeros((self.height, self.width, 3), uint8)
+        self.text_sizes = {}  # line -> (width, height)
+        self.cache = OrderedDict()  # tuple of lines -> Image
+        self.cache_size = cache_size
 
-        with open(self.rospack.get_path("thr_scenes")+"/config/"+self.scene+"/display.json") as f:
-            self.text = json.load(f)
+        self.text = SceneModel.load(self.scene, rospy.get_param('/thr/objects')[self.scene], self.rospack).display
 
         self.display_text(self.text['start'], [], self.font, self.scale, self.thickness, self.color, self.interline)
+        self.prerender(rospy.get_param('/thr/objects')[self.scene])
         rospy.Subscriber(self.action_history_name, ActionHistoryEvent, self.cb_action_event_received)
 
     def react_to_event(self, event):
@@ -62,44 +74,64 @@ class ConcurrentActionDisplay(object):
             return True
 
     def cb_action_event_received(self, msg):
-        def del_event():
-            # Deletes the last event and its associated STARTING event, if any
-            if self.events[-1].type != ActionHistoryEvent.STARTING:
-                # Remove the STARTING action corresponding to the last event
-                for event in range(len(self.events)-1, -1, -1):
-                    if self.events[event].action.id == self.events[-1].action.id and self.events[event].type == ActionHistoryEvent.STARTING:
-                        del self.events[event]
-                        break
-                # Remove the FINISHED action
-                self.events.pop()
-
-        self.events.append(msg)
+        self.history.add(msg)  # A FINISHED event removes its STARTING event from the running actions
         need_reaction = self.react_to_event(msg)
-        if msg.type != ActionHistoryEvent.STARTING:
-            del_event()
-        if not need_reaction and len(self.events)>0:
-            self.react_to_event(self.events[-1])
+        if not need_reaction and self.history.last_running() is not None:
+            self.react_to_event(self.history.last_running())
 
 
-    def display_text(self, lines, parameters=[], font=cv2.FONT_HERSHEY_SIMPLEX, scale=1, thickness=1, color=[255]*3, interline=1.1):
-        def center(sentence):
-            (width, height), _ = cv2.getTextSize(sentence, font, scale, thickness)
-            return (self.width-width)/2, height
+    def prerender(self, objects):
+        """
+        Fills the cache with the screens of all display.json entries, for all objects when the entry takes a parameter
+        Entries with several parameters (e.g. place) are left to the cache at runtime, their combinations being too many
+        """
+        for action, reactions in self.text.items():
+            if not isinstance(reactions, dict):
+                continue
+            for reaction in reactions.values():
+                indices = set(line for line in reaction['text'] if isinstance(line, int))
+                if indices == set([0]):
+                    for obj in objects:
+                        self.render(reaction['text'], [obj], self.font, self.scale, self.thickness, self.color, self.interline)
+                elif len(indices) == 0:
+                    self.render(reaction['text'], [], self.font, self.scale, self.thickness, self.color, self.interline)
+                if len(self.cache) >= self.cache_size:
+                    return
+
+    def text_size(self, line, font, scale, thickness):
+        key = (line, font, scale, thickness)
+        if key not in self.text_sizes:
+            self.text_sizes[key] = cv2.getTextSize(line, font, scale, thickness)[0]
+        return self.text_sizes[key]
 
-        y0 = (self.height - len(lines)*cv2.getTextSize('_', font, scale, thickness)[0][1]*interline)/2
-        img = zeros((self.height, self.width, 3), uint8)
+    def render(self, lines, parameters=[], font=cv2.FONT_HERSHEY_SIMPLEX, scale=1, thickness=1, color=[255]*3, interline=1.1):
+        """
+        :return: the Image message of these lines, from the cache if they have already been rendered
+        """
+        # ints are expanded with their associated parameter
+        lines = tuple(parameters[line].split('/')[-1].replace('_', ' ').upper() if isinstance(line, int) else line for line in lines)
+        key = (lines, font, scale, thickness, tuple(color), interline)
+        if key in self.cache:
+            msg = self.cache.pop(key)
+            self.cache[key] = msg  # Most recently used
+            return msg
+
+        y0 = (self.height - len(lines)*self.text_size('_', font, scale, thickness)[1]*interline)/2
+        self.frame.fill(0)
         for line_i, line in enumerate(lines):
-            if isinstance(line, int):  # ints are expanded with their associated parameter
-                line = parameters[line].split('/')[-1].replace('_', ' ').upper()
-            x = center(line)[0]
-            y = y0 + int(center(line)[1]*(line_i+1)*interline)
-            cv2.putText(img, line, (x, y), font, scale, color, thickness=thickness)
+            width, height = self.text_size(line, font, scale, thickness)
+            x = (self.width-width)/2
+            y = y0 + int(height*(line_i+1)*interline)
+            cv2.putText(self.frame, line, (int(x), int(y)), font, scale, color, thickness=thickness)
 
-        #cv2.imshow("Screen", img)
-        #cv2.waitKey(1)
-        msg = cv_bridge.CvBridge().cv2_to_imgmsg(img, encoding="bgr8")
-        self.image_pub.publish(msg)
+        msg = self.bridge.cv2_to_imgmsg(self.frame, encoding="bgr8")  # Copies the frame
+        self.cache[key] = msg
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return msg
 
+    def display_text(self, lines, parameters=[], font=cv2.FONT_HERSHEY_SIMPLEX, scale=1, thickness=1, color=[255]*3, interline=1.1):
+        self.image_pub.publish(self.render(lines, parameters, font, scale, thickness, color, interline))
 
 
 if __name__ == "__main__":
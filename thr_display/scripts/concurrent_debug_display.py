@@ -1,110 +1,191 @@
 #!/usr/bin/env python
 
 import rospy, rospkg
-from thr_infrastructure_msgs.msg import PredictedPlan
-from thr_infrastructure_msgs.srv import GetSceneStateRequest, GetSceneState
+from thr_infrastructure_msgs.msg import PredictedPlan, CompactSceneState, PredicateSchema
+from thr_scenes import PredicateSchema as Schema
+from threading import Condition
+from time import time
 import cv2, cv_bridge
 from numpy import zeros, uint8
 from sensor_msgs.msg import Image
 
+# Predicate types displayed in the left column, in this order. Other types are activities
+BUCKETS = [('attached', 'attached'), ('in_human_ws', 'in_hws'), ('positioned', 'positioned'), ('busy', 'busy'),
+           ('picked', 'picked'), ('at_home', 'at_home')]
+LINE_HEIGHT = 20  # Pixels between two baselines of text
+DESCENT = 5       # Pixels of the text below its baseline
+
 
 class ConcurrentDebugDisplay(object):
-    def __init__(self, width, height, rate, maximum_confidence=0.05, face=cv2.FONT_HERSHEY_SIMPLEX):
+    """
+    Displays the scene state and the predicted plan on the robot screen.
+    It is driven by the compact scene state and predicted plan topics: each panel is re-rendered only when its content
+    changed, and nothing is published when no panel changed.
+    """
+    def __init__(self, width, height, rate=None, maximum_confidence=0.05, face=cv2.FONT_HERSHEY_SIMPLEX):
+        """
+        :param rate: maximum frame rate in Hz, None for no cap
+        """
         self.rospack = rospkg.RosPack()
         self.face = face
-        self.rate = rospy.Rate(rate)
+        self.min_period = 1./rate if rate else 0.
         self.width, self.height = width, height
+        self.condition = Condition()
+        self.changed = True  # True when an input changed since the last render
 
+        self.schema = None
         self.state = None
-        self.old_state = None
+        self.buckets = {}  # type ID -> name of the left column bucket
 
         self.image_pub = rospy.Publisher('/robot/xdisplay', Image, latch=True, queue_size=1)
-
-        rospy.loginfo("[concurrent_debug_display] Waiting service /thr/scene_state...")
-        rospy.wait_for_service('/thr/scene_state')
-        self.getscene = rospy.ServiceProxy('/thr/scene_state', GetSceneState)
+        self.bridge = cv_bridge.CvBridge()
+        self.frame = zeros((self.height, self.width, 3), uint8)
+
+        # Panels: name -> (x0, y0, x1, y1) region of the frame and signature of the content displayed last
+        # Each panel draws within its region only, so that redrawing a panel never leaves text of another one
+        split = self.height//5 - LINE_HEIGHT  # Top of the plan panel, below the activities
+        self.regions = {'predicates': (0, 0, self.width//2, self.height),
+                        'activities': (self.width//2, 0, self.width, split),
+                        'plan': (self.width//2, split, self.width, self.height)}
+        self.signatures = dict((panel, None) for panel in self.regions)
+
+        # Render time counters
+        self.num_frames = 0
+        self.num_panels = 0
+        self.render_time = 0.
 
         # Attributes of predicted plans display
         self.predicted_plan = PredictedPlan()
-        self.old_predicted_plan = None
         self.maximum_confidence = maximum_confidence
+        rospy.Subscriber('/thr/predicate_schema', PredicateSchema, self.cb_schema)
+        rospy.Subscriber('/thr/compact_scene_state', CompactSceneState, self.cb_scene_state, queue_size=1)
         rospy.Subscriber('/thr/predicted_plan', PredictedPlan, self.handler_predicted_plan, queue_size=1)
+        rospy.on_shutdown(self.log_counters)
+
+    def cb_schema(self, msg):
+        with self.condition:
+            self.schema = Schema.from_msg(msg)
+            buckets = dict(BUCKETS)
+            self.buckets = dict((type_id, buckets.get(type, 'activity')) for type_id, type in enumerate(self.schema.types))
+            self.changed = True
+            self.condition.notify()
+
+    def cb_scene_state(self, msg):
+        with self.condition:
+            self.state = msg
+            self.changed = True
+            self.condition.notify()
 
     def handler_predicted_plan(self, msg):
-        self.predicted_plan = msg
-
-    def update_scene(self):
-        request = GetSceneStateRequest()
-        try:
-            scene = self.getscene(request).state
-        except rospy.ServiceException, e:
-            rospy.logerr("[concurrent_debug_display] Cannot update scene {}:".format(e.message))
-        else:
-            self.old_state = self.state
-            self.state = scene
-
-    def display_image(self):
-        img = zeros((self.height, self.width, 3), uint8)
-        preds = {"attached": [], "in_hws": [], "positioned": [], "busy": [], "picked": [], "at_home": [], "activity": []}
-        for p in self.state.predicates:
-            if p.type=='in_human_ws':
-                preds["in_hws"].append(p)
-            elif p.type=='positioned':
-                preds["positioned"].append(p)
-            elif p.type=='attached':
-                preds["attached"].append(p)
-            elif p.type=='picked':
-                preds["picked"].append(p)
-            elif p.type=='busy':
-                preds["busy"].append(p)
-            elif p.type=='at_home':
-                preds["at_home"].append(p)
-            else:
-                preds["activity"].append(p)
-
-        # Now draw the image with opencv
+        with self.condition:
+            self.predicted_plan = msg
+            self.changed = True
+            self.condition.notify()
+
+    def signatures_of(self, state, schema, plan):
+        """
+        :return: the content of each panel as hashable signatures
+        """
+        preds = dict((name, []) for _, name in BUCKETS + [('', 'activity')])
+        if state is not None and schema is not None and state.schema_revision == schema.revision:
+            for p in state.predicates:
+                preds[self.buckets.get(p.type, 'activity')].append(schema.decode(p))
+        return {'predicates': tuple((name, tuple(tuple(p.parameters) for p in preds[name])) for _, name in BUCKETS),
+                'activities': tuple((p.type, tuple(p.parameters)) for p in preds['activity']),
+                'plan': (tuple((d.type, tuple(d.parameters)) for d in plan.decisions), tuple(plan.confidences))}
+
+    def fits(self, panel, line):
+        """
+        :return: True if the line of text number `line` (1 for the first one) is within the region of panel
+        """
+        x0, y0, x1, y1 = self.regions[panel]
+        return y0 + LINE_HEIGHT*line + DESCENT <= y1
+
+    def draw_predicates(self, img, content):
+        x0, y0, x1, y1 = self.regions['predicates']
         line = 1
-        for i_pred, pred in preds.iteritems():
-            if i_pred=='activity':
-                continue
-            cv2.putText(img, '#'+i_pred.upper()+' ['+str(len(pred))+']', (10, 20*line), self.face, 0.55, [255]*3)
+        for i_pred, pred in content:
+            if not self.fits('predicates', line):
+                break
+            cv2.putText(img, '#'+i_pred.upper()+' ['+str(len(pred))+']', (x0 + 10, y0 + LINE_HEIGHT*line), self.face, 0.55, [255]*3)
             line+=1
-            for i, p in enumerate(pred):
-                cv2.putText(img, str(p.parameters), (50, 20*line), self.face, 0.5, [180]*3)
+            for parameters in pred:
+                if not self.fits('predicates', line):
+                    break
+                cv2.putText(img, str(list(parameters)), (x0 + 50, y0 + LINE_HEIGHT*line), self.face, 0.5, [180]*3)
                 line += 1
 
-        # Column 2: activities
-        cv2.putText(img, '# ACTIVITIES ['+str(len(preds['activity']))+']', (self.width/2, 20), self.face, 0.55, [255]*3)
+    def draw_activities(self, img, content):
+        x0, y0, x1, y1 = self.regions['activities']
+        cv2.putText(img, '# ACTIVITIES ['+str(len(content))+']', (x0, y0 + LINE_HEIGHT), self.face, 0.55, [255]*3)
         line = 2
-        for i, p in enumerate(preds['activity']):
-            cv2.putText(img, p.type+str(p.parameters), (self.width/2, 20*line), self.face, 0.5, [180]*3)
+        for type, parameters in content:
+            if not self.fits('activities', line):  # The count of the title tells how many are not displayed
+                break
+            cv2.putText(img, type+str(list(parameters)), (x0, y0 + LINE_HEIGHT*line), self.face, 0.5, [180]*3)
             line += 1
 
-        cv2.putText(img, '# PREDICTED PLAN ['+str(len(self.predicted_plan.decisions))+']', (self.width/2, self.height/5), self.face, 0.55, [255]*3)
-        line = 1
-        for i, decision in enumerate(self.predicted_plan.decisions):
-            # if decision.type != 'wait':
-            confidence = self.predicted_plan.confidences[i]
-            cv2.putText(img, decision.type + str(decision.parameters), (self.width/2, self.height/5 + 20*line), self.face, 0.5, self.confidence_to_bgr(confidence))
+    def draw_plan(self, img, content):
+        x0, y0, x1, y1 = self.regions['plan']
+        decisions, confidences = content
+        cv2.putText(img, '# PREDICTED PLAN ['+str(len(decisions))+']', (x0, y0 + LINE_HEIGHT), self.face, 0.55, [255]*3)
+        line = 2
+        for i, (type, parameters) in enumerate(decisions):
+            if not self.fits('plan', line):
+                break
+            confidence = confidences[i]
+            cv2.putText(img, type + str(list(parameters)), (x0, y0 + LINE_HEIGHT*line), self.face, 0.5, self.confidence_to_bgr(confidence))
             line += 1
 
-        #cv2.imshow("Predicates", img)
-        #cv2.waitKey(1)
-        msg = cv_bridge.CvBridge().cv2_to_imgmsg(img, encoding="bgr8")
-        self.image_pub.publish(msg)
-        self.old_predicted_plan = self.predicted_plan
+    def display_image(self, signatures):
+        """
+        Redraws the panels whose content changed
+        :return: True if the image has been published
+        """
+        start = time()
+        dirty = [panel for panel in self.regions if signatures[panel] != self.signatures[panel]]
+        if len(dirty) == 0:
+            return False
+        for panel in dirty:
+            x0, y0, x1, y1 = self.regions[panel]
+            self.frame[y0:y1, x0:x1] = 0
+        for panel in ['predicates', 'activities', 'plan']:
+            if panel in dirty:
+                getattr(self, 'draw_'+panel)(self.frame, signatures[panel])
+                self.signatures[panel] = signatures[panel]
+
+        self.image_pub.publish(self.bridge.cv2_to_imgmsg(self.frame, encoding="bgr8"))
+        self.num_frames += 1
+        self.num_panels += len(dirty)
+        self.render_time += time() - start
+        return True
+
+    def log_counters(self):
+        if self.num_frames > 0:
+            rospy.loginfo("[concurrent_debug_display] {} frames, {} panels redrawn, {:.2f} ms per frame".format(
+                          self.num_frames, self.num_panels, 1000*self.render_time/self.num_frames))
 
     def confidence_to_bgr(self, confidence):
         ratio = min(self.maximum_confidence, confidence) / self.maximum_confidence
         return 0, int(255 * (1 - ratio)), int(255 * ratio)
 
     def start(self):
+        last_frame = 0.
         while not rospy.is_shutdown():
-            self.update_scene()
-            if not self.old_state or self.state.predicates != self.old_state.predicates or self.predicted_plan != self.old_predicted_plan:
-                self.display_image()
-            self.rate.sleep()
+            with self.condition:
+                while not self.changed and not rospy.is_shutdown():
+                    self.condition.wait(1)
+                self.changed = False
+                signatures = self.signatures_of(self.state, self.schema, self.predicted_plan)
+            if self.display_image(signatures):
+                last_frame = time()
+                if self.num_frames % 100 == 0:
+                    self.log_counters()
+            # Frame rate cap
+            remaining = self.min_period - (time() - last_frame)
+            if remaining > 0:
+                rospy.sleep(remaining)
 
 if __name__ == "__main__":
     rospy.init_node('concurrent_debug_display')
-    ConcurrentDebugDisplay(1024, 600, 10).start()
\ No newline at end of file
+    ConcurrentDebugDisplay(1024, 600, 10).start()
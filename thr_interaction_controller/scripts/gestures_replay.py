@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+"""
+Replays recorded Kinect skeleton streams offline through the skeleton tracker and the gesture filters of the gestures
+interaction controller and prints the operator changes, the transitions of the filtered gestures and the processing
+time per frame.
+Streams are recorded with --record (requires the Kinect 2 server), one JSON frame per line.
+Without stream, a synthetic one is generated.
+"""
+import argparse
+import json
+import random
+import rospkg
+from time import time, sleep
+from thr_interaction_controller import HandGestures, SkeletonTracker, ReplayKinectClient, read_skeleton_stream
+
+
+def record(path, duration, host):
+    from kinect2.client import Kinect2Client
+    kinect = Kinect2Client(host)
+    num_frames = [0]
+    with open(path, 'w') as f:
+        def cb_skeleton(msg):
+            f.write(json.dumps({'stamp': time(), 'skeletons': msg}) + '\n')
+            num_frames[0] += 1
+        kinect.skeleton.set_callback(cb_skeleton)
+        kinect.skeleton.start()
+        sleep(duration)
+        kinect.skeleton.stop()
+    print("Recorded {} frames in {}".format(num_frames[0], path))
+
+
+def joints(x, y, z):
+    return dict((joint, {'Position': {'X': x + dx, 'Y': y + dy, 'Z': z}})
+                for joint, dx, dy in [('Head', 0., 0.5), ('WristLeft', -0.3, 0.), ('WristRight', 0.3, 0.)])
+
+
+def synthetic_stream(num_frames, num_bodies, rate, table, seed=0):
+    """
+    An operator at the table showing each gesture in turn during a few seconds, with 10% of noisy hand states,
+    and bystanders walking by behind. The Kinect changes the body id of someone from time to time.
+    """
+    rng = random.Random(seed)
+    gestures = ['Open', 'Closed', 'Lasso', 'NotTracked']
+    body_ids = ['body{}'.format(body) for body in range(num_bodies)]
+    for i in range(num_frames):
+        stamp = float(i) / rate
+        if rng.random() < 0.01:
+            body_ids[rng.randrange(num_bodies)] = 'body{}'.format(rng.randrange(1000000))
+        skeletons = {}
+        for body in range(num_bodies):
+            state = gestures[int(stamp / 5. + body) % len(gestures)]
+            if rng.random() < 0.1:
+                state = rng.choice(gestures + ['Unknown'])
+            if body == 0:
+                skeleton = joints(table[0] + rng.gauss(0, 0.01), table[1], table[2] + rng.gauss(0, 0.01))
+            else:
+                # Walking at 1 m/s along the x axis, further from the table than the operator
+                x = ((stamp + 2.5 * body) % 5.) - 2.5
+                skeleton = joints(x, table[1], table[2] + 0.8 + 0.5 * body)
+            skeleton['HandRight'] = {'HandState': state}
+            skeletons[body_ids[body]] = skeleton
+        yield stamp, skeletons
+
+
+def replay(frames, config, verbose):
+    kinect = ReplayKinectClient(frames)
+    tracker = SkeletonTracker.from_config(config['tracker'])
+    gestures = HandGestures(config['filter'])
+    transitions = []
+    operators = []
+    last = {}
+    multi_body = [0, 0.]  # Number of frames with several bodies and time spent on them
+
+    def cb_skeleton(msg):
+        start = time()
+        skeletons = tracker.update(msg, kinect.stamp)
+        gestures.update(skeletons, kinect.stamp)
+        if len(msg) > 1:
+            multi_body[0] += 1
+            multi_body[1] += time() - start
+        if len(operators) == 0 or operators[-1][1] != tracker.operator:
+            operators.append((kinect.stamp, tracker.operator))
+        for track_id in skeletons:
+            state = gestures.state(track_id)
+            if last.get(track_id, '') != state:
+                last[track_id] = state
+                transitions.append((kinect.stamp, track_id, state, track_id == tracker.operator))
+
+    kinect.skeleton.set_callback(cb_skeleton)
+    start = time()
+    num_frames = kinect.run()
+    elapsed = time() - start
+
+    if verbose:
+        for stamp, track_id in operators:
+            print("{:10.3f} operator is track {}".format(stamp, track_id))
+        for stamp, track_id, state, operator in transitions:
+            print("{:10.3f} {:>6}{} -> {}".format(stamp, track_id, '*' if operator else ' ', state if state else "none"))
+    print("{} frames, {} tracks, {} operator changes, {} transitions".format(
+        num_frames, tracker.next_id, len(operators) - 1, len(transitions)))
+    if num_frames > 0:
+        print("{:.1f} us/frame, {:.0f} frames/s".format(1e6 * elapsed / num_frames, num_frames / elapsed if elapsed > 0 else float('inf')))
+    if multi_body[0] > 0:
+        print("{} multi-body frames: {:.1f} us/frame for tracking and filtering".format(multi_body[0], 1e6 * multi_body[1] / multi_body[0]))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('stream', nargs='?', help="recorded skeleton stream (JSON lines)")
+    parser.add_argument('--record', help="record a skeleton stream in this file instead of replaying")
+    parser.add_argument('--duration', type=float, default=60., help="duration of the recording in seconds")
+    parser.add_argument('--host', default='BAXTERFLOWERS.local', help="host of the Kinect 2 server")
+    parser.add_argument('--frames', type=int, default=100000, help="number of frames of the synthetic stream")
+    parser.add_argument('--bodies', type=int, default=1, help="number of bodies of the synthetic stream")
+    parser.add_argument('--rate', type=float, default=30., help="frame rate of the synthetic stream")
+    parser.add_argument('--config', help="gestures config, defaults to the one of thr_interaction_controller")
+    parser.add_argument('-v', '--verbose', action='store_true', help="print the transitions")
+    args = parser.parse_args()
+
+    if args.record:
+        record(args.record, args.duration, args.host)
+    else:
+        config_path = args.config or rospkg.RosPack().get_path("thr_interaction_controller") + "/config/gestures.json"
+        with open(config_path) as config_file:
+            config = json.load(config_file)
+        if args.stream:
+            frames = read_skeleton_stream(args.stream)
+        else:
+            frames = synthetic_stream(args.frames, args.bodies, args.rate, config['tracker']['table_position'])
+        replay(frames, config, args.verbose)
@@ -4,19 +4,23 @@ import rospy
 import rospkg
 import actionlib
 import json
+import tf
 from random import choice
 from threading import Lock
 
 from thr_infrastructure_msgs.msg import *
 from thr_infrastructure_msgs.srv import *
 from actionlib_msgs.msg import *
-from collections import deque
 from kinect2.client import Kinect2Client
+from thr_interaction_controller import EpisodeCoordinator, PredictionCache, HandGestures, SkeletonTracker, Wakeup,\
+    SpeechCommandQueue, ros_to_kinect
+from thr_action_server import Tracer
 
 class InteractionController(object):
     def __init__(self):
         self.lock = Lock()
         self.running = True
+        self.decision_in_flight = False  # True until the decision server replied to the last decision
         self.waiting = False
         self.last_predicition_confidence = None
         self.last_predicted_decision_str = None
@@ -30,15 +34,14 @@ class InteractionController(object):
         # Kinect controls
         self.kinect = Kinect2Client('BAXTERFLOWERS.local')
         self.last_skeleton = None
-        self.skeleton_id = ''
-        self.hand_state = {'filtered_state': ''}
-        self.speech = deque()
-        self.speech_lock = Lock()
+        self.operator = None  # Track id of the skeleton interacting with the robot
+        self.gesture = ''  # Filtered gesture of the operator
+        self.wakeup = Wakeup()  # The loop runs when a command is spoken, the gesture changes or the decision server replied
         self.last_sentence = ''
         self.last_speak = rospy.Time(0)
 
         # Parameters to be tweaked
-        self.interaction_loop_rate = rospy.Rate(1)
+        self.poll_period = 1.  # The scene state and the predictions can only be polled
         self.reward_service = '/thr/learner'
         self.predictor_service = 'thr/predictor'
         self.scene_state_service = '/thr/scene_state'
@@ -53,6 +56,18 @@ class InteractionController(object):
             rospy.wait_for_service(service)
 
         self.rospack = rospkg.RosPack()
+        self.episode = EpisodeCoordinator()
+        self.tracer = Tracer('interaction_controller')
+        self.prediction_cache = PredictionCache()
+
+        with open(self.rospack.get_path("thr_interaction_controller")+"/config/gestures.json") as config_file:
+            self.gestures_config = json.load(config_file)
+        self.hand_gestures = HandGestures(self.gestures_config['filter'])
+        self.speech = SpeechCommandQueue(self.gestures_config['speech']['queue_size'],
+                                         self.gestures_config['speech']['max_age'], on_command=self.wakeup.notify)
+        self.skeleton_tracker = SkeletonTracker.from_config(self.gestures_config['tracker'])
+        self.tfl = tf.TransformListener()
+        rospy.Timer(rospy.Duration(1.), self.cb_update_table)
 
         with open(self.rospack.get_path("thr_action_server")+"/config/decision_action_mapping.json") as config_file:
             self.decision_action_mapping = json.load(config_file)
@@ -72,67 +87,46 @@ class InteractionController(object):
             self.last_sentence = sentence
             self.last_speak = rospy.get_time()
 
-    def cb_skeleton(self, msg):
-        num_skeletons = len(msg.keys())
-        if self.skeleton_id == '':
-            if num_skeletons > 1:
-                rospy.logwarn("{} skeletons are visible, ignoring frame".format(num_skeletons))
-            elif num_skeletons == 0:
-                rospy.logwarn("No skeleton visible, ignoring frame")
-            else:
-                self.skeleton_id = msg.keys()[0]
-                rospy.loginfo("Selected skeleton {}".format(self.skeleton_id))
+    def cb_update_table(self, event):
+        """
+        The operator is selected by proximity to the table, located in the camera frame when TF knows both frames.
+        The camera frame follows the ROS axes (x forward) while the skeletons are in the camera space of the Kinect
+        """
+        config = self.gestures_config['tracker']
+        try:
+            position = self.tfl.lookupTransform(config['camera_frame'], config['table_frame'], rospy.Time(0))[0]
+            self.skeleton_tracker.table = ros_to_kinect(position)
+        except (tf.LookupException, tf.ConnectivityException, tf.ExtrapolationException):
+            pass
 
-        if num_skeletons > 0 and self.skeleton_id != '':
-            try:
-                self.last_skeleton = msg[self.skeleton_id]
-            except KeyError:
-                # Skeleton ID has changed
-                rospy.logwarn("Skeleton ID has changed")
-                self.say("I'm tracking someone else")
-                self.skeleton_id = ''
-                self.last_skeleton = None
-
-        ####### Hand state filtering
-        # If you're looking for the end filtered state this is self.hand_state['filtered_state']
-        activating_duration = 3
-        stopping_duration = 2
-        timeout_duration = 3.5  # The gesture expires within 3.5 sec if it hasn't been activated, must be >  other durations
-        if self.last_skeleton is not None:
-            hand_state = self.last_skeleton['HandRight']['HandState']
-            if hand_state not in self.hand_state:
-                self.hand_state[hand_state] = {}
-            if 'filtered_state' not in self.hand_state:
-                self.hand_state['filtered_state'] = ''
-            if hand_state in ['NotTracked', 'Unknown'] or self.hand_state['filtered_state'] != '' and hand_state != self.hand_state['filtered_state']:
-                if self.hand_state['filtered_state'] != "":
-                    if 'disappeared' not in self.hand_state[self.hand_state['filtered_state']]:
-                        self.hand_state[self.hand_state['filtered_state']]['disappeared'] = rospy.get_time()
-                    elif rospy.get_time() - self.hand_state[self.hand_state['filtered_state']]['disappeared'] > stopping_duration:
-                        del self.hand_state[self.hand_state['filtered_state']]['disappeared']
-                        self.hand_state['filtered_state'] = ""
-                        rospy.loginfo("Switch to {}".format(self.hand_state['filtered_state']))
+    def cb_skeleton(self, msg):
+        stamp = rospy.get_time()
+        skeletons = self.skeleton_tracker.update(msg, stamp)  # All visible bodies, by track id
+        operator = self.skeleton_tracker.operator
+        if operator != self.operator:
+            if operator is None:
+                rospy.logwarn("No skeleton visible")
             else:
-                if self.hand_state['filtered_state'] == "":
-                    if 'appeared' not in self.hand_state[hand_state]:
-                        self.hand_state[hand_state]['appeared'] = rospy.get_time()
-                    elif rospy.get_time() - self.hand_state[hand_state]['appeared'] > activating_duration:
-                        self.hand_state['filtered_state'] = hand_state
-                        rospy.loginfo("Switch to {}".format(self.hand_state['filtered_state']))
-                        del self.hand_state[hand_state]['appeared']
-
-            for gesture in self.hand_state:
-                if 'appeared' in self.hand_state[gesture] and rospy.get_time() - self.hand_state[gesture]['appeared'] > timeout_duration:
-                    del self.hand_state[gesture]['appeared']
-                if 'disappeared' in self.hand_state[gesture] and rospy.get_time() - self.hand_state[gesture]['disappeared'] > timeout_duration:
-                    del self.hand_state[gesture]['disappeared']
+                rospy.loginfo("Selected skeleton {} among {}".format(operator, len(skeletons)))
+                if self.operator is not None:
+                    self.say("I'm tracking someone else")
+            self.operator = operator
+        if operator in skeletons:
+            self.last_skeleton = skeletons[operator]
+
+        # Hand state filtering, each body has its own filter so that a reselected body keeps its history
+        self.hand_gestures.update(skeletons, stamp)
+        gesture = self.hand_gestures.state(operator)
+        if gesture != self.gesture:
+            self.gesture = gesture
+            rospy.loginfo("Switch to {}".format(gesture))
+            self.wakeup.notify()
 
     def cb_speech(self, msg):
-        with self.speech_lock:
-            try:
-                self.speech.append(msg['semantics'])
-            except KeyError as e:
-                rospy.logerr("Malformed speech message: no key {}".format(e.message))
+        try:
+            self.speech.push(msg['semantics'], rospy.get_time(), msg.get('confidence', 1.))
+        except KeyError as e:
+            rospy.logerr("Malformed speech message: no key {}".format(e.message))
 
     def start_kinect_services(self):
         self.kinect.skeleton.set_callback(self.cb_skeleton)
@@ -176,31 +170,35 @@ class InteractionController(object):
             rospy.logerr("Cannot update scene {}:".format(e.message))
 
     def predict(self):
+        key = self.prediction_cache.key(self.current_scene)
+        prediction = self.prediction_cache.get(key)
+        if prediction is not None:
+            self.tracer.predicted(prediction.decisions)
+            return prediction
         request = GetNextDecisionRequest()
         request.scene_state = self.current_scene
         try:
             predict = rospy.ServiceProxy(self.predictor_service, GetNextDecision)
-            return predict(request)
+            prediction = predict(request)
+            self.prediction_cache.put(key, prediction)
+            self.tracer.predicted(prediction.decisions)
+            return prediction
         except rospy.ServiceException as e:
             rospy.logerr("Cannot call predictor:".format(e.message))
             decision = Decision(type='wait')
             return GetNextDecisionResponse(decisions=[decision], probas=[1.])
 
     def start_or_stop_episode(self, start=True):
-        for node in ['scene_state_manager', 'scene_state_updater', 'action_server', 'learner_predictor']:
-            url = '/thr/{}/start_stop'.format(node)
-            rospy.wait_for_service(url)
-            rospy.ServiceProxy(url, StartStopEpisode).call(StartStopEpisodeRequest(
-                command=StartStopEpisodeRequest.START if start else
-                StartStopEpisodeRequest.STOP))
+        self.episode.start_or_stop(start)
 
     ###################################################################################################################
 
     def process_speech(self):
-        with self.speech_lock:
-            decisions = [Decision(type=speech[0], parameters=speech[1:]) for speech in self.speech]
-            self.speech.clear()
-        return decisions
+        """
+        :return: the Decision of the best spoken command still queued, None if there is none
+        """
+        command = self.speech.pop(rospy.get_time())
+        return None if command is None else Decision(type=command[0], parameters=list(command[1:]))
 
     def run_decision(self, decision):
         if decision.type == 'wait':
@@ -209,12 +207,21 @@ class InteractionController(object):
         os.system('beep')
         goal = RunDecisionGoal()
         goal.decision = decision
-        self.run_decision_client.send_goal(goal)
-        while self.run_decision_client.get_state() in [GoalStatus.PENDING, GoalStatus.ACTIVE] and not rospy.is_shutdown():
-            self.interaction_loop_rate.sleep()
+        self.tracer.dispatched(decision)
+        self.decision_in_flight = True  # Set before sending, the reply may come before send_goal returns
+        self.run_decision_client.send_goal(goal, done_cb=self.cb_decision_done)
         self.current_decision = decision
         return False
 
+    def cb_decision_done(self, state, result):
+        """
+        Called by the action client when the decision server replied. Decisions are always successful unless they are not mapped to an arm
+        """
+        self.decision_in_flight = False
+        if state != GoalStatus.SUCCEEDED:
+            rospy.logwarn("Decision server did not run the last decision, status {}".format(state))
+        self.wakeup.notify()
+
     def run(self):
         def decision_to_tts(decision):
             obj = decision.parameters[0].split('/')[-1].replace('_', ' ')
@@ -228,9 +235,20 @@ class InteractionController(object):
             return [decision for index, decision in enumerate(actions.decisions) if
                         action in decision.type and all_decisions.probas[index] > 0.]
 
+        def find(decisions, spoken):
+            # Spoken decisions have no trace id, they are matched on their type and parameters
+            for decision in decisions:
+                if decision.type == spoken.type and decision.parameters == spoken.parameters:
+                    return decision
+            return None
+
         if not rospy.is_shutdown():
+            revision = 0
             try:
                 while self.running and not rospy.is_shutdown():
+                    revision = self.wakeup.wait(revision, self.poll_period)
+                    if self.decision_in_flight:
+                        continue
                     self.update_scene()
                     all_decisions = self.predict()
 
@@ -246,15 +264,14 @@ class InteractionController(object):
                             decision.parameters = decision.parameters #+ map(str, flattened_gesture_pose) + [
                         else:
                             self.say("Please tell or show me what to do")
-                            gesture = self.hand_state['filtered_state']
+                            gesture = self.gesture
                             wait = False
 
-                            speech_decisions = self.process_speech()
-                            if len(speech_decisions) > 0:
-                                if speech_decisions[0] in holds or speech_decisions[0] in picks:
-                                    decision = speech_decisions[0]
-                                else:
-                                    action, obj = decision_to_tts(speech_decisions[0])
+                            speech_decision = self.process_speech()
+                            if speech_decision is not None:
+                                decision = find(holds + picks, speech_decision)
+                                if decision is None:
+                                    action, obj = decision_to_tts(speech_decision)
                                     self.say("I cannot {} {} now".format(action, obj))
                                     wait = True
                             else:
@@ -274,7 +291,6 @@ class InteractionController(object):
                                     wait = True
 
                             if wait:
-                                self.interaction_loop_rate.sleep()
                                 continue
 
                             rospy.logwarn("You showed a {} gesture corresponding to a {} action".format(gesture, decision.type))
@@ -288,7 +304,6 @@ class InteractionController(object):
                                       'type': type,
                                       'parameters': params})
                     self.run_decision(decision)
-                    self.interaction_loop_rate.sleep()
             finally:
                 logs_name = rospy.get_param('/thr/logs_name')
                 if logs_name != "none":
@@ -7,20 +7,25 @@ import json
 from thr_infrastructure_msgs.msg import *
 from thr_infrastructure_msgs.srv import *
 from actionlib_msgs.msg import *
+from thr_interaction_controller import EpisodeCoordinator, Wakeup, SceneStateListener, PredictionCache
+from thr_action_server import Tracer
 
 
 class InteractionController(object):
     def __init__(self, interaction_rate=20):
         self.running = True
+        self.decision_in_flight = False  # True until the decision server replied to the last decision
         self.current_scene = None
+        self.scene_revision = 0
+        self.predicted_input = None  # Input of the last prediction, the predictor is not called again until it changes
+        self.wakeup = Wakeup()  # The loop runs when the scene state changes or the decision server replied
 
         self.logs = []
 
         # Parameters to be tweaked
-        self.interaction_loop_rate = rospy.Rate(interaction_rate)
+        self.interaction_loop_rate = rospy.Rate(interaction_rate)  # Maximum rate of decisions
         self.reward_service = '/thr/learner'
         self.predictor_service = 'thr/predictor'
-        self.scene_state_service = '/thr/scene_state'
         self.run_decision_name = '/thr/run_decision'
         self.action_history_name = '/thr/action_history'
 
@@ -28,12 +33,16 @@ class InteractionController(object):
         self.run_decision_client = actionlib.SimpleActionClient(self.run_decision_name, RunDecisionAction)
         rospy.loginfo("Waiting action client {}...".format(self.run_decision_name))
         self.run_decision_client.wait_for_server()
-        for service in [self.reward_service, self.predictor_service, self.scene_state_service]:
+        for service in [self.reward_service, self.predictor_service]:
             rospy.loginfo("Waiting service {}...".format(service))
             rospy.wait_for_service(service)
 
         self.rospack = rospkg.RosPack()
+        self.episode = EpisodeCoordinator()
+        self.tracer = Tracer('interaction_controller')
         rospy.Subscriber(self.action_history_name, ActionHistoryEvent, self.cb_action_event_received)
+        self.scene_listener = SceneStateListener(on_change=self.wakeup.notify)
+        self.prediction_cache = PredictionCache(on_change=self.wakeup.notify)
 
         with open(self.rospack.get_path("thr_action_server")+"/config/decision_action_mapping.json") as config_file:
             self.decision_action_mapping = json.load(config_file)
@@ -63,15 +72,23 @@ class InteractionController(object):
             reward(request)
 
     def update_scene(self):
-        request = GetSceneStateRequest()
-        try:
-            getscene = rospy.ServiceProxy(self.scene_state_service, GetSceneState)
-        except rospy.ServiceException as e:
-            rospy.logerr("Cannot update scene {}:".format(e.message))
-        else:
-            self.current_scene = getscene(request).state
+        revision, scene = self.scene_listener.get()
+        if scene is not None:
+            self.current_scene = scene
+            self.scene_revision = revision
+
+    def prediction_input(self):
+        """
+        :return: a hashable summary of the inputs of the predictor, it is called again only when they changed
+        """
+        return self.scene_revision, self.prediction_cache.version
 
     def predict(self, current_scene):
+        key = self.prediction_cache.key(current_scene)
+        prediction = self.prediction_cache.get(key)
+        if prediction is not None:
+            self.tracer.predicted(prediction.decisions)
+            return prediction
         request = GetNextDecisionRequest()
         request.scene_state = current_scene
         try:
@@ -81,7 +98,10 @@ class InteractionController(object):
             decision = Decision(type='wait')
             return GetNextActionResponse(decisions=[decision], probas=[1.])
         else:
-            return predict(request)
+            prediction = predict(request)
+            self.prediction_cache.put(key, prediction)
+            self.tracer.predicted(prediction.decisions)
+            return prediction
 
     @staticmethod
     def get_most_probable_decision(prediction):
@@ -93,14 +113,8 @@ class InteractionController(object):
                 most_probable_decision_id = decision_id
         return prediction.decisions[most_probable_decision_id]
 
-    @staticmethod
-    def start_or_stop_episode(start=True):
-        for node in ['scene_state_manager', 'scene_state_updater', 'action_server', 'learner_predictor']:
-            url = '/thr/{}/start_stop'.format(node)
-            rospy.wait_for_service(url)
-            rospy.ServiceProxy(url, StartStopEpisode).call(StartStopEpisodeRequest(
-                command=StartStopEpisodeRequest.START if start else
-                StartStopEpisodeRequest.STOP))
+    def start_or_stop_episode(self, start=True):
+        self.episode.start_or_stop(start)
 
     ###################################################################################################################
     def run_decision(self, decision):
@@ -109,9 +123,18 @@ class InteractionController(object):
         os.system('beep')
         goal = RunDecisionGoal()
         goal.decision = decision
-        self.run_decision_client.send_goal(goal)
-        while self.run_decision_client.get_state() in [GoalStatus.PENDING, GoalStatus.ACTIVE] and not rospy.is_shutdown():
-            self.interaction_loop_rate.sleep()
+        self.tracer.dispatched(decision)
+        self.decision_in_flight = True  # Set before sending, the reply may come before send_goal returns
+        self.run_decision_client.send_goal(goal, done_cb=self.cb_decision_done)
+
+    def cb_decision_done(self, state, result):
+        """
+        Called by the action client when the decision server replied. Decisions are always successful unless they are not mapped to an arm
+        """
+        self.decision_in_flight = False
+        if state != GoalStatus.SUCCEEDED:
+            rospy.logwarn("Decision server did not run the last decision, status {}".format(state))
+        self.wakeup.notify()
 
     def init(self):
         rospy.loginfo('Interaction starting in independent mode, without GUI nor speech')
@@ -120,6 +143,9 @@ class InteractionController(object):
 
     def loop(self):
         self.update_scene()
+        if self.current_scene is None or self.decision_in_flight or self.prediction_input() == self.predicted_input:
+            return
+        self.predicted_input = self.prediction_input()
         prediction = self.predict(self.current_scene)
         decision = self.get_most_probable_decision(prediction)
         self.run_decision(decision)
@@ -128,7 +154,11 @@ class InteractionController(object):
     def run(self):
         try:
             self.init()
+            revision = None
             while self.running and not rospy.is_shutdown():
+                if revision is not None:
+                    self.wakeup.wait(revision)
+                revision = self.wakeup.revision  # Events received while processing will trigger the next iteration
                 self.loop()
         finally:
             logs_name = rospy.get_param('/thr/logs_name')
@@ -17,6 +17,8 @@ from baxter_commander import Halo
 from baxter_interface import Head
 
 from RBLT.domains import domain_dict
+from thr_interaction_controller import EpisodeCoordinator, Wakeup, SceneStateListener, PredictionCache, QuestionManager
+from thr_action_server import Tracer
 
 
 def Decision_to_relational_action(decision):
@@ -36,8 +38,69 @@ def relational_action_to_Decision(action):
                         parameters=[])
 
 
+uf_strings = {}  # Decision string -> user-friendly string, the set of decisions of a domain is small
+
+
 def to_uf(string):
-    return string.replace("start_", "").replace("/toolbox/", "").replace("0", "triangle").replace("1", "square").replace("handle", "yellow").replace("side_right", "red").replace("side_left", "green").replace("side_front", "blue").replace("side_back", "black")
+    uf_string = uf_strings.get(string)
+    if uf_string is None:
+        uf_string = string.replace("start_", "").replace("/toolbox/", "").replace("0", "triangle").replace("1", "square").replace("handle", "yellow").replace("side_right", "red").replace("side_left", "green").replace("side_front", "blue").replace("side_back", "black")
+        uf_strings[string] = uf_string
+    return uf_string
+
+
+class DecisionTable(object):
+    """
+    Bidirectional Decision <-> action id map of a RBLT domain with the robot and human masks of the action ids.
+    The domain cannot enumerate its actions, so each decision is converted and classified the first time it is seen,
+    filtering is then a mask over the ids of the candidates.
+    """
+    def __init__(self, domain):
+        self.domain = domain
+        self.ids = {}      # (type, parameters) -> action id
+        self.actions = {}  # action id -> (type, parameters)
+        self.robot = np.zeros(0, dtype=bool)
+        self.human = np.zeros(0, dtype=bool)
+
+    def id(self, decision):
+        key = (decision.type, tuple(decision.parameters))
+        action_id = self.ids.get(key)
+        if action_id is None:
+            action_id = self.domain.action_to_int(Decision_to_relational_action(decision))
+            decision = relational_action_to_Decision(self.domain.int_to_action(action_id))
+            self.ids[key] = action_id
+            self.actions[action_id] = (decision.type, tuple(decision.parameters))
+            if action_id >= len(self.robot):
+                padding = np.zeros(max(action_id + 1, 2 * len(self.robot)) - len(self.robot), dtype=bool)
+                self.robot = np.concatenate((self.robot, padding))
+                self.human = np.concatenate((self.human, padding))
+            self.robot[action_id] = len(self.domain.filter_robot_actions([action_id])) > 0
+            self.human[action_id] = len(self.domain.filter_human_actions([action_id])) > 0
+        return action_id
+
+    def ids_of(self, decision_list):
+        return np.array([self.id(d) for d in decision_list], dtype=int)
+
+    def decision(self, action_id):
+        type, parameters = self.actions[action_id]
+        return Decision(type=type, parameters=list(parameters))
+
+    def filter(self, decision_list, human=False):
+        """
+        :param human: keep the human decisions instead of the robot ones
+        :return: the decisions of decision_list done by the robot (or the human), in the same order
+        """
+        ids = self.ids_of(decision_list)  # Converts first, the masks may grow
+        if len(ids) == 0:
+            return []
+        mask = self.human if human else self.robot
+        return [self.decision(a) for a in ids[mask[ids]]]
+
+    def is_robot(self, decision):
+        return bool(self.robot[self.id(decision)])
+
+    def is_human(self, decision):
+        return bool(self.human[self.id(decision)])
 
 class HeadSignal():
     def __init__(self):
@@ -235,6 +298,7 @@ class InteractionController(object):
     def __init__(self):
         self.lock = Lock()
         self.running = True
+        self.decision_in_flight = False  # True until the decision server replied to the last decision
         self.waiting = False
         self.last_predicition_confidence = None
         self.last_predicted_decision_str = None
@@ -244,6 +308,7 @@ class InteractionController(object):
         self.info_question = None
         self.feedback_question_list = []
         self.domain = domain_dict["multi_agent_box_coop"].Domain({"random_start": False}, "/tmp")
+        self.decision_table = DecisionTable(self.domain)
 
         self.current_scene = None
         self.last_scene = None
@@ -251,11 +316,15 @@ class InteractionController(object):
         self.logs = []
         self.head = HeadSignal()
 
+        # The loop runs when an input changes (scene state, action history, decision reply, web_asker answers)
+        self.wakeup = Wakeup()
+        self.poll_period = 0.5  # Inputs that can only be polled: pause param, background phases
+        self.scene_revision = 0
+        self.predicted_input = None  # Input of the last prediction, the predictor is not called again until it changes
+
         # Parameters to be tweaked
-        self.interaction_loop_rate = rospy.Rate(20)
         self.reward_service = '/thr/learner'
         self.predictor_service = 'thr/predictor'
-        self.scene_state_service = '/thr/scene_state'
         self.run_decision_name = '/thr/run_decision'
         self.action_history_name = '/thr/action_history'
 
@@ -263,14 +332,18 @@ class InteractionController(object):
         self.run_decision_client = actionlib.SimpleActionClient(self.run_decision_name, RunDecisionAction)
         rospy.loginfo("Waiting action client {}...".format(self.run_decision_name))
         self.run_decision_client.wait_for_server()
-        for service in [self.reward_service, self.predictor_service, self.scene_state_service]:
+        for service in [self.reward_service, self.predictor_service]:
             rospy.loginfo("Waiting service {}...".format(service))
             rospy.wait_for_service(service)
 
+        self.episode = EpisodeCoordinator()
+        self.tracer = Tracer('interaction_controller')
         self.rospack = rospkg.RosPack()
         self.web_asker = None
         self.init_webasker()
         rospy.Subscriber(self.action_history_name, ActionHistoryEvent, self.cb_action_event_received)
+        self.scene_listener = SceneStateListener(on_change=self.wakeup.notify)
+        self.prediction_cache = PredictionCache(on_change=self.wakeup.notify)
 
         with open(self.rospack.get_path("thr_action_server")+"/config/decision_action_mapping.json") as config_file:
             self.decision_action_mapping = json.load(config_file)
@@ -280,7 +353,14 @@ class InteractionController(object):
             adress_list = json.load(adress_file)
         for adress in adress_list:
             try:
-                self.web_asker = web_asker.WebAsker(adress)
+                # All pending questions are refreshed together in background with a single query on the collection
+                # of the web asker, answers wake the interaction loop up
+                asker = web_asker.WebAsker(adress)
+                collection = getattr(asker, 'questions', None)
+                if collection is None:
+                    rospy.logwarn("The web asker does not expose its questions collection, each question will be polled")
+                self.web_asker = QuestionManager(asker, period=self.poll_period, on_answer=self.wakeup.notify,
+                                                 collection=collection)
             except Exception as e:
                 rospy.loginfo(e)
                 rospy.loginfo("Cannot reach {}.".format(adress))
@@ -314,6 +394,7 @@ class InteractionController(object):
             if event.side == 'human' and event.type == ActionHistoryEvent.STARTING:
                 assert self.last_human_decision is None
                 self.last_human_decision = event.action
+        self.wakeup.notify()
 
     #################################################
     # SERVICE CALLERS ###############################
@@ -334,20 +415,32 @@ class InteractionController(object):
             rospy.logerr("Cannot set training example: {}".format(e.message))
 
     def update_scene(self):
-        request = GetSceneStateRequest()
-        try:
-            getscene = rospy.ServiceProxy(self.scene_state_service, GetSceneState)
+        revision, scene = self.scene_listener.get()
+        if scene is not None:
             self.last_scene = self.current_scene
-            self.current_scene = getscene(request).state
-        except rospy.ServiceException as e:
-            rospy.logerr("Cannot update scene {}:".format(e.message))
+            self.current_scene = scene
+            self.scene_revision = revision
+
+    def prediction_input(self):
+        """
+        :return: a hashable summary of the inputs of the predictor, it is called again only when they changed
+        """
+        return self.scene_revision, self.prediction_cache.version
 
     def predict(self):
+        key = self.prediction_cache.key(self.current_scene)
+        prediction = self.prediction_cache.get(key)
+        if prediction is not None:
+            self.tracer.predicted(prediction.decisions)
+            return prediction
         request = GetNextDecisionRequest()
         request.scene_state = self.current_scene
         try:
             predict = rospy.ServiceProxy(self.predictor_service, GetNextDecision)
-            return predict(request)
+            prediction = predict(request)
+            self.prediction_cache.put(key, prediction)
+            self.tracer.predicted(prediction.decisions)
+            return prediction
         except rospy.ServiceException as e:
             rospy.logerr("Cannot call predictor:".format(e.message))
             decision = Decision(type='wait')
@@ -355,12 +448,7 @@ class InteractionController(object):
 
     def start_or_stop_episode(self, start=True):
         self.head.reset_signal()
-        for node in ['scene_state_manager', 'scene_state_updater', 'action_server', 'learner_predictor']:
-            url = '/thr/{}/start_stop'.format(node)
-            rospy.wait_for_service(url)
-            rospy.ServiceProxy(url, StartStopEpisode).call(StartStopEpisodeRequest(
-                command=StartStopEpisodeRequest.START if start else
-                StartStopEpisodeRequest.STOP))
+        self.episode.start_or_stop(start)
 
     ###################################################################################################################
 
@@ -385,11 +473,20 @@ class InteractionController(object):
         self.head.reset_signal()
         goal = RunDecisionGoal()
         goal.decision = decision
-        self.run_decision_client.send_goal(goal)
-        while self.run_decision_client.get_state() in [GoalStatus.PENDING, GoalStatus.ACTIVE] and not rospy.is_shutdown():
-            self.interaction_loop_rate.sleep()
+        self.tracer.dispatched(decision)
+        self.decision_in_flight = True  # Set before sending, the reply may come before send_goal returns
+        self.run_decision_client.send_goal(goal, done_cb=self.cb_decision_done)
         self.current_decision = decision
 
+    def cb_decision_done(self, state, result):
+        """
+        Called by the action client when the decision server replied. Decisions are always successful unless they are not mapped to an arm
+        """
+        self.decision_in_flight = False
+        if state != GoalStatus.SUCCEEDED:
+            rospy.logwarn("Decision server did not run the last decision, status {}".format(state))
+        self.wakeup.notify()
+
     def handle_human_decision(self):
         if self.last_human_decision is not None:
             if self.info_question is not None and not self.info_question.is_user_engaged():
@@ -506,6 +603,7 @@ class InteractionController(object):
         return False
 
     def get_prediction(self):
+        self.predicted_input = self.prediction_input()
         prediction = self.predict()
         str_action_list = [self.Decision_to_str(a) for a in self.filter_robot_decisions(prediction.decisions)]
         if np.sum(prediction.probas) != 1:
@@ -519,7 +617,7 @@ class InteractionController(object):
         self.last_predicted_decision_str = action_str
         self.last_predicition_confidence = prediction.confidence
 
-        if len(self.filter_robot_decisions([predicted_decision])) > 0:
+        if self.decision_table.is_robot(predicted_decision):
             if prediction.confidence > 0.01:
                 self.confirm_question = ConfirmQuestion(self.web_asker, action_str, str_action_list, self.current_scene,
                                                         prediction.confidence, head=self.head)
@@ -530,7 +628,7 @@ class InteractionController(object):
                                                                     self.current_scene, prediction.confidence, key))
 
                 self.run_decision(predicted_decision)
-        elif len(self.filter_human_decisions([predicted_decision])) > 0:
+        elif self.decision_table.is_human(predicted_decision):
             if len(str_action_list) > 0:
                 self.info_question = InfoQuestion(self.web_asker, action_str, str_action_list, self.current_scene,
                                                   prediction.confidence)
@@ -544,27 +642,31 @@ class InteractionController(object):
         return True
 
     def filter_human_decisions(self, decision_list):
-        decision_list_as_int = [self.domain.action_to_int(Decision_to_relational_action(d)) for d in decision_list]
-        filtered_decision_list_as_int = self.domain.filter_human_actions(decision_list_as_int)
-        return [relational_action_to_Decision(self.domain.int_to_action(a)) for a in filtered_decision_list_as_int]
+        return self.decision_table.filter(decision_list, human=True)
 
     def filter_robot_decisions(self, decision_list):
-        decision_list_as_int = [self.domain.action_to_int(Decision_to_relational_action(d)) for d in decision_list]
-        filtered_decision_list_as_int = self.domain.filter_robot_actions(decision_list_as_int)
-        return [relational_action_to_Decision(self.domain.int_to_action(a)) for a in filtered_decision_list_as_int]
+        return self.decision_table.filter(decision_list)
 
     def run(self):
         try:
             print('Interaction starting!')
 
             is_running = False
+            learning_prompt = None
             start_stop_question = self.web_asker.ask("Start assembly?", ["Let's go!"], priority=30, color="grey")
 
             rospy.set_param("/thr/paused", False)
 
+            revision = None
             while self.running and not rospy.is_shutdown():
+                if revision is not None:
+                    self.wakeup.wait(revision, self.poll_period)
+                revision = self.wakeup.revision  # Events received while processing will trigger the next iteration
                 with self.lock:
                     if not is_running:
+                        if learning_prompt is not None and len(self.episode.pending()) == 0:
+                            learning_prompt.remove()
+                            learning_prompt = None
                         if start_stop_question.answered():
                             start_stop_question.remove()
                             is_running = True
@@ -590,36 +692,33 @@ class InteractionController(object):
                             question.remove()
                         self.feedback_question_list = []
 
+                        # The arms go home and the learner retrains in background, the prompt is removed when they are done
                         learning_prompt = self.web_asker.ask("Learning...", [], color="grey")
                         self.start_or_stop_episode(False)
-                        learning_prompt.remove()
                         start_stop_question = self.web_asker.ask("Restart assembly?", ["Restart!"], priority=30, color="grey")
 
                     else:
 
                         if self.handle_human_decision():
-                            self.interaction_loop_rate.sleep()
                             continue
 
                         self.update_scene()
+                        if self.current_scene is None:
+                            continue  # No scene state received yet
 
                         if self.update_questions():
-                            self.interaction_loop_rate.sleep()
                             continue
 
                         if self.check_pause():
-                            self.interaction_loop_rate.sleep()
                             continue
 
                         if self.handle_waiting():
-                            self.interaction_loop_rate.sleep()
                             continue
 
-                        if self.get_prediction():
-                            self.interaction_loop_rate.sleep()
+                        if self.decision_in_flight or self.prediction_input() == self.predicted_input:
                             continue
 
-                    self.interaction_loop_rate.sleep()
+                        self.get_prediction()
         finally:
             logs_name = rospy.get_param('/thr/logs_name')
             if logs_name != "none":
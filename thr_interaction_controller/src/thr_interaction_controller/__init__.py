@@ -0,0 +1,8 @@
+from . episode import EpisodeCoordinator
+from . events import Wakeup, SceneStateListener
+from . prediction_cache import PredictionCache
+from . questions import QuestionManager, LocalWebAsker
+from . gestures import GestureFilter, HandGestures, ReplayKinectClient, read_skeleton_stream
+from . skeletons import SkeletonTracker, ros_to_kinect
+from . speech import SpeechCommandQueue
+from . keyboard import CommandTable, KeyboardController
@@ -0,0 +1,121 @@
+import rospy
+from threading import Thread, Condition
+from thr_infrastructure_msgs.msg import EpisodeProgress
+from thr_infrastructure_msgs.srv import StartStopEpisode, StartStopEpisodeRequest
+
+NODES = ['scene_state_manager', 'scene_state_updater', 'action_server', 'learner_predictor']
+
+
+class EpisodeCoordinator(object):
+    """
+    Starts or stops an episode on all nodes concurrently.
+    Nodes may reply before the end of their slow phases (homing, retraining...), these phases are tracked in background
+    through /thr/episode_progress and a new episode only starts once all phases of the previous stop are finished.
+    """
+    def __init__(self, nodes=NODES, service_timeout=None, on_progress=None, background_timeout=300.):
+        """
+        :param nodes: names of the nodes to start/stop, as in /thr/<node>/start_stop
+        :param service_timeout: timeout waiting for each start_stop service (None = wait forever)
+        :param background_timeout: timeout waiting for the background phases of the previous stop before a start
+        (None = wait forever)
+        :param on_progress: optional callback receiving each EpisodeProgress message
+        """
+        self.nodes = nodes
+        self.service_timeout = service_timeout
+        self.on_progress = on_progress
+        self.background_timeout = background_timeout
+        self.progress_name = '/thr/episode_progress'
+        self.condition = Condition()
+        self.background = {}  # (node, phase) -> time at which the phase has been announced
+        self.finished = {}    # (node, phase) -> time at which the phase has been reported finished
+        rospy.Subscriber(self.progress_name, EpisodeProgress, self.cb_progress)
+
+    def cb_progress(self, msg):
+        with self.condition:
+            if msg.finished:
+                self.finished[(msg.node, msg.phase)] = rospy.get_time()
+                self.background.pop((msg.node, msg.phase), None)
+                self.condition.notify_all()
+        if msg.finished and msg.error != '':
+            rospy.logerr("[EpisodeCoordinator] {} {} failed: {}".format(msg.node, msg.phase, msg.error))
+        else:
+            rospy.loginfo("[EpisodeCoordinator] {} {} {}".format(msg.node, msg.phase, "finished" if msg.finished else "running"))
+        if callable(self.on_progress):
+            self.on_progress(msg)
+
+    def _call(self, node, command, replies):
+        url = '/thr/{}/start_stop'.format(node)
+        called = rospy.get_time()
+        try:
+            rospy.wait_for_service(url, self.service_timeout)
+            reply = rospy.ServiceProxy(url, StartStopEpisode).call(StartStopEpisodeRequest(command=command))
+        except (rospy.ROSException, rospy.ServiceException) as e:
+            replies[node] = e
+            return
+        replies[node] = reply
+        with self.condition:
+            for phase in reply.background:
+                # The end of the phase may have been received before the reply
+                if self.finished.get((node, phase), -1) < called:
+                    self.background[(node, phase)] = called
+
+    def start_or_stop(self, start=True, wait_background=False):
+        """
+        Sends START or STOP to all nodes at the same time and returns when all of them replied
+        :param start: True to start an episode, False to stop it
+        :param wait_background: True to also wait for the background phases to finish
+        :return: True if all nodes replied successfully
+        """
+        if start:
+            # The robot must be homed and the learner trained before starting again
+            if not self.wait_background(self.background_timeout) and not rospy.is_shutdown():
+                pending = self.forget_background()
+                rospy.logerr("[EpisodeCoordinator] Starting anyway after {}s, still running: {}".format(
+                    self.background_timeout, ', '.join('{} {}'.format(node, phase) for node, phase in pending)))
+        command = StartStopEpisodeRequest.START if start else StartStopEpisodeRequest.STOP
+        replies = {}
+        threads = [Thread(target=self._call, args=(node, command, replies)) for node in self.nodes]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        success = True
+        for node in self.nodes:
+            if not hasattr(replies.get(node), 'background'):
+                rospy.logerr("[EpisodeCoordinator] Cannot {} episode on {}: {}".format("start" if start else "stop", node, replies.get(node)))
+                success = False
+        if wait_background:
+            self.wait_background()
+        return success
+
+    def pending(self):
+        """
+        :return: the list of (node, phase) still running in background
+        """
+        with self.condition:
+            return list(self.background)
+
+    def forget_background(self):
+        """
+        Stops waiting for the background phases still running, e.g. those of a node that died before finishing them
+        :return: the list of (node, phase) forgotten
+        """
+        with self.condition:
+            pending = list(self.background)
+            self.background.clear()
+            return pending
+
+    def wait_background(self, timeout=None):
+        """
+        Blocks until all background phases are finished
+        :return: True if they are all finished, False in case of timeout or shutdown
+        """
+        deadline = None if timeout is None else rospy.get_time() + timeout
+        with self.condition:
+            while len(self.background) > 0 and not rospy.is_shutdown():
+                remaining = 0.1 if deadline is None else min(0.1, deadline - rospy.get_time())
+                if remaining <= 0:
+                    return False
+                self.condition.wait(remaining)
+            return len(self.background) == 0
@@ -0,0 +1,84 @@
+import rospy
+from threading import Condition, Lock
+from thr_infrastructure_msgs.msg import CompactSceneState, PredicateSchema
+from thr_scenes import PredicateSchema as Schema
+
+
+class Wakeup(object):
+    """
+    Wakes up an interaction loop when one of its inputs changed, instead of polling at a fixed rate.
+    Callbacks call notify(), the loop remembers the revision it processed and waits for a newer one.
+    """
+    def __init__(self):
+        self.condition = Condition()
+        self.revision = 0
+
+    def notify(self, *args):
+        """
+        Can be used directly as a topic or action callback, arguments are ignored
+        """
+        with self.condition:
+            self.revision += 1
+            self.condition.notify_all()
+
+    def wait(self, revision, timeout=None):
+        """
+        Blocks until an event newer than revision happened
+        :param revision: the revision processed last by the caller
+        :param timeout: maximum time to wait in seconds, for inputs that can only be polled
+        :return: the current revision
+        """
+        deadline = None if timeout is None else rospy.get_time() + timeout
+        with self.condition:
+            while self.revision == revision and not rospy.is_shutdown():
+                remaining = 0.1 if deadline is None else min(0.1, deadline - rospy.get_time())
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+            return self.revision
+
+
+class SceneStateListener(object):
+    """
+    Keeps the last scene state published on /thr/compact_scene_state, decoded into a SceneState only when it changes
+    """
+    def __init__(self, on_change=None):
+        """
+        :param on_change: optional callable called without arguments each time the scene state changed
+        """
+        self.lock = Lock()
+        self.on_change = on_change
+        self.schema = None
+        self.compact = None
+        self.state = None
+        self.revision = 0  # Incremented at each new decoded scene state
+        rospy.Subscriber('/thr/predicate_schema', PredicateSchema, self.cb_schema)
+        rospy.Subscriber('/thr/compact_scene_state', CompactSceneState, self.cb_scene_state, queue_size=1)
+
+    def cb_schema(self, msg):
+        with self.lock:
+            self.schema = Schema.from_msg(msg)
+            changed = self._decode()
+        if changed and callable(self.on_change):
+            self.on_change()
+
+    def cb_scene_state(self, msg):
+        with self.lock:
+            self.compact = msg
+            changed = self._decode()
+        if changed and callable(self.on_change):
+            self.on_change()
+
+    def _decode(self):
+        if self.schema is None or self.compact is None or self.compact.schema_revision != self.schema.revision:
+            return False
+        self.state = self.schema.decode_state(self.compact)
+        self.revision += 1
+        return True
+
+    def get(self):
+        """
+        :return: (revision, SceneState) of the last scene state, SceneState being None if none has been received yet
+        """
+        with self.lock:
+            return self.revision, self.state
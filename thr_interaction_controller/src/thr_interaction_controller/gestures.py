@@ -0,0 +1,188 @@
+import json
+from collections import deque
+
+# Hand states of the Kinect that are not gestures
+UNTRACKED = ('NotTracked', 'Unknown')
+
+
+class Window(object):
+    """
+    Frames of a GestureFilter received during the last `duration` seconds, with the number of frames of each state
+    """
+    def __init__(self, duration):
+        self.duration = duration
+        self.frames = deque()
+        self.counts = {}
+
+    def add(self, frame):
+        stamp, state = frame
+        self.frames.append(frame)
+        self.counts[state] = self.counts.get(state, 0) + 1
+        while self.frames[0][0] < stamp - self.duration:
+            self.drop()
+
+    def drop(self):
+        stamp, state = self.frames.popleft()
+        self.counts[state] -= 1
+
+    def ratio(self, state):
+        return float(self.counts.get(state, 0)) / len(self.frames) if len(self.frames) > 0 else 0.
+
+    def clear(self):
+        self.frames.clear()
+        self.counts.clear()
+
+
+class GestureFilter(object):
+    """
+    Debounced hand state of one body, updated in O(1) per frame.
+    A gesture is activated once it has been shown in at least `agreement` of the frames of the last `activating`
+    seconds, and stopped once it has been shown in less than 1 - `agreement` of the frames of the last `stopping`
+    seconds. The frames are forgotten if the body is not seen for `timeout` seconds, which stops the gesture.
+    """
+    def __init__(self, activating=3., stopping=2., timeout=3.5, agreement=0.8, size=128):
+        """
+        :param size: maximum number of frames kept, must cover the longest duration at the frame rate of the Kinect
+        """
+        self.timeout = timeout
+        self.agreement = agreement
+        self.ring = deque(maxlen=size)  # (stamp, hand state), the oldest first
+        self.activating = Window(activating)
+        self.stopping = Window(stopping)
+        self.since = None  # Stamp of the first frame after the last reset, windows are not full before
+        self.state = ''    # Filtered state, '' if no gesture
+
+    def reset(self, stamp=None):
+        self.ring.clear()
+        self.activating.clear()
+        self.stopping.clear()
+        self.since = stamp
+        self.state = ''
+
+    def update(self, hand_state, stamp):
+        """
+        :param hand_state: the raw hand state of the new frame
+        :param stamp: time of the frame in seconds
+        :return: the filtered state
+        """
+        if len(self.ring) > 0 and stamp - self.ring[-1][0] > self.timeout:
+            self.reset(stamp)
+        elif self.since is None:
+            self.since = stamp
+        if len(self.ring) == self.ring.maxlen:
+            # Frames dropped from the ring are dropped from the windows that still contain them
+            oldest = self.ring[0]
+            for window in (self.activating, self.stopping):
+                if len(window.frames) > 0 and window.frames[0] is oldest:
+                    window.drop()
+        frame = (stamp, hand_state)
+        self.ring.append(frame)
+        self.activating.add(frame)
+        self.stopping.add(frame)
+
+        if self.state == '':
+            if (hand_state not in UNTRACKED and stamp - self.since >= self.activating.duration and
+                    self.activating.ratio(hand_state) >= self.agreement):
+                self.state = hand_state
+        elif (stamp - self.since >= self.stopping.duration and
+                self.stopping.ratio(self.state) < 1 - self.agreement):
+            self.state = ''
+        return self.state
+
+    def expired(self, stamp):
+        """
+        :return: True if no frame has been received for more than the timeout
+        """
+        return len(self.ring) == 0 or stamp - self.ring[-1][0] > self.timeout
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        :param config: the 'filter' section of thr_interaction_controller/config/gestures.json
+        """
+        return cls(config['activating_duration'], config['stopping_duration'], config['timeout_duration'],
+                   config['agreement'], config['ring_size'])
+
+
+class HandGestures(object):
+    """
+    Filtered right hand gesture of each visible body, a body keeps its filter until it expires
+    """
+    def __init__(self, config):
+        """
+        :param config: the 'filter' section of thr_interaction_controller/config/gestures.json
+        """
+        self.config = config
+        self.filters = {}  # body id -> GestureFilter
+
+    def update(self, skeletons, stamp):
+        """
+        :param skeletons: dict body id -> skeleton of a Kinect frame
+        :param stamp: time of the frame in seconds
+        """
+        for body_id, skeleton in skeletons.items():
+            gesture_filter = self.filters.get(body_id)
+            if gesture_filter is None:
+                gesture_filter = self.filters[body_id] = GestureFilter.from_config(self.config)
+            gesture_filter.update(skeleton['HandRight']['HandState'], stamp)
+        if len(self.filters) > len(skeletons):
+            for body_id in [b for b, f in self.filters.items() if f.expired(stamp)]:
+                del self.filters[body_id]
+
+    def state(self, body_id):
+        """
+        :return: the filtered gesture of this body, '' if none
+        """
+        gesture_filter = self.filters.get(body_id)
+        return '' if gesture_filter is None else gesture_filter.state
+
+
+def read_skeleton_stream(path):
+    """
+    Reads skeleton frames recorded one per line as JSON {"stamp": seconds, "skeletons": {body id: skeleton}}
+    :return: a generator of (stamp, skeletons)
+    """
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                frame = json.loads(line)
+                yield frame['stamp'], frame['skeletons']
+
+
+class ReplaySkeleton(object):
+    def __init__(self):
+        self.callback = None
+
+    def set_callback(self, callback):
+        self.callback = callback
+
+    def start(self):
+        return ''
+
+    def stop(self):
+        return ''
+
+
+class ReplayKinectClient(object):
+    """
+    Stand-in of kinect2.client.Kinect2Client replaying skeleton frames offline, as fast as possible.
+    stamp is the time of the frame being delivered to the skeleton callback.
+    """
+    def __init__(self, frames):
+        """
+        :param frames: iterable of (stamp, skeletons), e.g. read_skeleton_stream(path)
+        """
+        self.frames = frames
+        self.skeleton = ReplaySkeleton()
+        self.stamp = None
+
+    def run(self):
+        """
+        :return: the number of frames replayed
+        """
+        num_frames = 0
+        for self.stamp, skeletons in self.frames:
+            if self.skeleton.callback is not None:
+                self.skeleton.callback(skeletons)
+            num_frames += 1
+        return num_frames
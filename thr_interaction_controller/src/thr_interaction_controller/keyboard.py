@@ -0,0 +1,176 @@
+import rospy
+import rospkg
+import actionlib
+import json
+import sys
+try:
+    from Queue import Queue, Empty
+except ImportError:
+    from queue import Queue, Empty
+from threading import Thread, Event
+from actionlib_msgs.msg import GoalStatus
+from thr_infrastructure_msgs.msg import Decision, RunDecisionAction, RunDecisionGoal
+from thr_action_server import Tracer
+from . episode import EpisodeCoordinator
+from . events import SceneStateListener
+
+
+class CommandTable(object):
+    """
+    Parses the keyboard commands of a scene, described in thr_scenes/config/<scene>/commands.json:
+    the first letter selects a command and each following letter selects one of its arguments in the table of this
+    argument. An argument may give one or several parameters, or a suffix appended to the decision type.
+    """
+    def __init__(self, config):
+        self.commands = config['commands']  # letter -> {'type': decision type, 'arguments': [argument names]}
+        self.arguments = config['arguments']  # argument name -> {letter -> parameter or list of parameters}
+        self.suffixes = config.get('suffixes', {})  # argument name -> {letter -> suffix of the decision type}
+
+    @classmethod
+    def from_scene(cls, scene):
+        with open('{}/config/{}/commands.json'.format(rospkg.RosPack().get_path('thr_scenes'), scene)) as f:
+            return cls(json.load(f))
+
+    def parse(self, text):
+        """
+        :param text: a command typed by the operator, e.g. 'hl0'
+        :return: the Decision of this command
+        :raise ValueError: if the command is invalid, with the reason
+        """
+        command = text.strip('\r\n ').lower()
+        if len(command) == 0 or command[0] not in self.commands:
+            raise ValueError("Invalid command '{}', unknown action".format(command))
+        spec = self.commands[command[0]]
+        arguments = spec.get('arguments', [])
+        if len(command) != len(arguments) + 1:
+            raise ValueError("Invalid command '{}', {} expects {} argument(s): {}".format(
+                command, spec['type'], len(arguments), ', '.join(arguments)))
+        type, parameters = spec['type'], []
+        for letter, argument in zip(command[1:], arguments):
+            table = self.suffixes.get(argument, self.arguments.get(argument, {}))
+            if letter not in table:
+                raise ValueError("Invalid command '{}', '{}' is not a {} ({})".format(
+                    command, letter, argument, '/'.join(sorted(table))))
+            if argument in self.suffixes:
+                type += table[letter]
+            elif isinstance(table[letter], list):
+                parameters += table[letter]
+            else:
+                parameters.append(table[letter])
+        return Decision(type=type, parameters=parameters)
+
+    def help(self):
+        lines = []
+        for letter, spec in sorted(self.commands.items()):
+            arguments = spec.get('arguments', [])
+            lines.append("{}{} {}".format(letter, ''.join('<{}>'.format(a) for a in arguments), spec['type']))
+        for argument, table in sorted(list(self.arguments.items()) + list(self.suffixes.items())):
+            lines.append("<{}> {}".format(argument, ', '.join('{}={}'.format(k, v) for k, v in sorted(table.items()))))
+        return '\n'.join(lines)
+
+
+class KeyboardController(object):
+    """
+    Wizard-of-Oz interaction controller: commands typed by the operator (or submitted by another source) are parsed
+    with the CommandTable of the scene and queued, so that the operator can type ahead while the previous decisions
+    are running. Decisions are dispatched in order, each one once the decision server replied to the previous one.
+    Scene state changes are displayed as they are received.
+    """
+    def __init__(self, scene, nodes, keyboard=True):
+        """
+        :param scene: name of the scene, to load its commands
+        :param nodes: nodes to start an episode on
+        :param keyboard: True to read the commands from the standard input
+        """
+        self.running = True
+        self.commands = CommandTable.from_scene(scene)
+        self.pending = Queue()  # Decisions typed ahead, not dispatched yet
+        self.idle = Event()  # Set when no decision is running
+        self.idle.set()
+        self.current_decision = None
+        self.logs = []
+        self.last_predicates = set()
+
+        self.run_decision_name = '/thr/run_decision'
+        self.run_decision_client = actionlib.SimpleActionClient(self.run_decision_name, RunDecisionAction)
+        rospy.loginfo("Waiting action client {}...".format(self.run_decision_name))
+        self.run_decision_client.wait_for_server()
+
+        self.tracer = Tracer('interaction_controller')
+        self.scene_listener = SceneStateListener(on_change=self.cb_scene_changed)
+        self.episode = EpisodeCoordinator(nodes)
+        self.episode.start_or_stop(True)  # Start a new (and unique) episode
+
+        if keyboard:
+            self.input_thread = Thread(target=self.read_input)
+            self.input_thread.setDaemon(True)
+            self.input_thread.start()
+
+    def cb_scene_changed(self):
+        revision, scene = self.scene_listener.get()
+        predicates = set((p.type, tuple(p.parameters)) for p in scene.predicates)
+        for sign, changed in (('+', predicates - self.last_predicates), ('-', self.last_predicates - predicates)):
+            for type, parameters in sorted(changed):
+                rospy.loginfo("{} {}({})".format(sign, type, ', '.join(parameters)))
+        self.last_predicates = predicates
+
+    def read_input(self):
+        print(self.commands.help())
+        while self.running and not rospy.is_shutdown():
+            line = sys.stdin.readline()
+            if len(line) == 0:  # End of file
+                break
+            if line.strip() != '':
+                self.submit(line)
+
+    def submit(self, text):
+        """
+        Parses a command and queues its decision
+        :return: an empty string if the command is valid, the error message otherwise
+        """
+        try:
+            decision = self.commands.parse(text)
+        except ValueError as e:
+            rospy.logerr(str(e))
+            return str(e)
+        self.pending.put(decision)
+        if not self.idle.is_set():
+            rospy.loginfo("Queued decision {}({}), {} pending".format(decision.type, ', '.join(decision.parameters),
+                                                                      self.pending.qsize()))
+        return ''
+
+    def run_decision(self, decision):
+        self.logs.append({'timestamp': rospy.get_time(),
+                          'type': decision.type,
+                          'parameters': decision.parameters})
+        self.current_decision = decision
+        self.tracer.dispatched(decision)
+        self.idle.clear()  # Cleared before sending, the reply may come before send_goal returns
+        self.run_decision_client.send_goal(RunDecisionGoal(decision=decision), done_cb=self.cb_decision_done)
+        rospy.loginfo("You're asking to run decision {}({})".format(decision.type, ', '.join(decision.parameters)))
+
+    def cb_decision_done(self, state, result):
+        decision = self.current_decision
+        if state == GoalStatus.SUCCEEDED:
+            rospy.loginfo("Decision {}({}) succeeded!".format(decision.type, ', '.join(decision.parameters)))
+        else:
+            rospy.logwarn("Decision {}({}) failed ;-(".format(decision.type, ', '.join(decision.parameters)))
+        self.idle.set()
+
+    def run(self):
+        rospy.loginfo('Manual interaction starting from keyboard!')
+        try:
+            while self.running and not rospy.is_shutdown():
+                if not self.idle.wait(0.1):
+                    continue
+                try:
+                    decision = self.pending.get(timeout=0.1)
+                except Empty:
+                    continue
+                self.run_decision(decision)
+        finally:
+            self.running = False
+            logs_name = rospy.get_param('/thr/logs_name')
+            if logs_name != "none":
+                with open('decisions_'+logs_name+'.json', 'w') as f:
+                    json.dump(self.logs, f)
@@ -0,0 +1,78 @@
+import rospy
+from collections import OrderedDict
+from copy import deepcopy
+from threading import Lock
+from thr_infrastructure_msgs.msg import ModelVersion
+
+
+class PredictionCache(object):
+    """
+    Client-side cache of the predictor replies, keyed by a canonical form of the scene state and the model version
+    published by the learner/predictor. The cache is cleared when the version changes and disabled while no version
+    has been received (e.g. a predictor that does not publish its version).
+    Replies are copied in and out, so that tracing or dispatching the decisions of a reply never alters the cache or
+    the decisions returned before.
+    """
+    def __init__(self, size=256, topic='/thr/predictor/model_version', on_change=None):
+        """
+        :param size: maximum number of replies kept, the least recently used are dropped first
+        :param topic: topic of the ModelVersion published by the predictor
+        :param on_change: optional callable called without arguments each time the model version changed
+        """
+        self.size = size
+        self.on_change = on_change
+        self.lock = Lock()
+        self.version = None
+        self.replies = OrderedDict()  # (version, scene key) -> GetNextDecisionResponse
+        self.hits = 0
+        self.misses = 0
+        rospy.Subscriber(topic, ModelVersion, self.cb_model_version)
+
+    def cb_model_version(self, msg):
+        with self.lock:
+            changed = msg.version != self.version
+            if changed:
+                self.version = msg.version
+                self.replies.clear()
+        if changed and callable(self.on_change):
+            self.on_change()
+
+    @staticmethod
+    def scene_key(scene_state):
+        """
+        :return: a canonical hashable form of a SceneState, independent of the order of its predicates
+        """
+        return frozenset((p.type, tuple(p.parameters)) for p in scene_state.predicates)
+
+    def key(self, scene_state):
+        """
+        :return: the key of this scene state for the current model version, None if caching is disabled
+        """
+        with self.lock:
+            return None if self.version is None else (self.version, self.scene_key(scene_state))
+
+    def get(self, key):
+        """
+        :return: a copy of the cached reply or None
+        """
+        if key is None:
+            return None
+        with self.lock:
+            reply = self.replies.pop(key, None)
+            if reply is None:
+                self.misses += 1
+                return None
+            self.replies[key] = reply  # Most recently used
+            self.hits += 1
+            return deepcopy(reply)
+
+    def put(self, key, reply):
+        """
+        Stores a copy of a reply obtained for a key, unless the model version changed during the request
+        """
+        with self.lock:
+            if key is None or key[0] != self.version:
+                return
+            self.replies[key] = deepcopy(reply)
+            if len(self.replies) > self.size:
+                self.replies.popitem(last=False)
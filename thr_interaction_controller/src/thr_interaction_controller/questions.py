@@ -0,0 +1,187 @@
+import rospy
+from itertools import count
+from threading import Thread, Lock, Event
+
+
+class ManagedQuestion(object):
+    """
+    Question asked through a QuestionManager, answered() and get_answer() read the last answer fetched by the manager
+    instead of querying the backend
+    """
+    def __init__(self, manager, question):
+        self.manager = manager
+        self.question = question
+        self.answer = None
+        self.is_answered = False
+
+    def answered(self):
+        return self.is_answered
+
+    def get_answer(self):
+        return self.answer
+
+    def remove(self):
+        self.manager.forget(self)
+        self.question.remove()
+
+
+class QuestionManager(object):
+    """
+    Single access point to the web asker: the pending questions are refreshed together in a background thread
+    at a fixed period instead of each polling the database at every tick of the interaction loop.
+    All pending answers are fetched with a single query if the backend provides get_answers(ids) or if the MongoDB
+    collection of its questions is given, otherwise each pending question is polled once per period.
+    Questions already answered are not polled anymore.
+    """
+    def __init__(self, web_asker, period=0.5, on_answer=None, collection=None, answer_field='answer'):
+        """
+        :param web_asker: the backend, a web_asker.WebAsker or a LocalWebAsker
+        :param period: time between two refreshes in seconds
+        :param on_answer: optional callable called without arguments when new answers have been received
+        :param collection: pymongo collection in which the backend stores its questions by id (_id), None if unknown
+        :param answer_field: field of the documents of collection holding the answer, missing or None if unanswered
+        """
+        self.web_asker = web_asker
+        self.period = period
+        self.on_answer = on_answer
+        self.collection = collection
+        self.answer_field = answer_field
+        self.bulk = callable(getattr(web_asker, 'get_answers', None)) or collection is not None
+        self.lock = Lock()
+        self.pending = []
+        self.queries = 0  # Number of queries sent to the backend by refresh()
+        self.stopped = Event()
+        self.thread = Thread(target=self.run)
+        self.thread.setDaemon(True)
+        self.thread.start()
+
+    def ask(self, *args, **kwargs):
+        """
+        Asks a question to the backend, same arguments as web_asker.WebAsker.ask()
+        :return: a ManagedQuestion
+        """
+        question = ManagedQuestion(self, self.web_asker.ask(*args, **kwargs))
+        with self.lock:
+            self.pending.append(question)
+        return question
+
+    def forget(self, question):
+        with self.lock:
+            if question in self.pending:
+                self.pending.remove(question)
+
+    def clear_all(self):
+        with self.lock:
+            self.pending = []
+        self.web_asker.clear_all()
+
+    def get_answers(self, ids):
+        """
+        Fetches the answers of several questions with a single query to the backend
+        :return: dict id -> answer of the questions answered among ids
+        """
+        if self.collection is None:
+            return self.web_asker.get_answers(ids)
+        documents = self.collection.find({'_id': {'$in': ids}, self.answer_field: {'$ne': None}}, {self.answer_field: 1})
+        return dict((document['_id'], document[self.answer_field]) for document in documents)
+
+    def refresh(self):
+        """
+        Fetches the answers of all pending questions, the backend is not locked during the queries
+        :return: True if at least one new answer has been received
+        """
+        with self.lock:
+            pending = list(self.pending)
+        if len(pending) == 0:
+            return False
+
+        answers = {}
+        if self.bulk:
+            self.queries += 1
+            replies = self.get_answers([question.question.id for question in pending])
+            for question in pending:
+                if question.question.id in replies:
+                    answers[question] = replies[question.question.id]
+        else:
+            for question in pending:
+                self.queries += 1
+                if question.question.answered():
+                    answers[question] = question.question.get_answer()
+
+        with self.lock:
+            for question, answer in answers.items():
+                question.answer = answer
+                question.is_answered = True
+                if question in self.pending:
+                    self.pending.remove(question)
+        if len(answers) > 0 and callable(self.on_answer):
+            self.on_answer()
+        return len(answers) > 0
+
+    def run(self):
+        while not self.stopped.is_set() and not rospy.is_shutdown():
+            try:
+                self.refresh()
+            except Exception as e:
+                rospy.logwarn("Cannot refresh the web asker questions: {}".format(e))
+            self.stopped.wait(self.period)
+
+    def stop(self):
+        self.stopped.set()
+
+
+class LocalQuestion(object):
+    def __init__(self, web_asker, id, text, answers, priority, color):
+        self.web_asker = web_asker
+        self.id = id
+        self.text = text
+        self.answers = answers
+        self.priority = priority
+        self.color = color
+        self.answer = None
+
+    def answered(self):
+        self.web_asker.queries += 1
+        return self.answer is not None
+
+    def get_answer(self):
+        return self.answer
+
+    def remove(self):
+        self.web_asker.questions.pop(self.id, None)
+
+
+class LocalWebAsker(object):
+    """
+    In-memory stand-in of the MongoDB-backed web_asker.WebAsker, answers are given with answer().
+    It supports the bulk query of QuestionManager and counts the queries it receives.
+    """
+    def __init__(self):
+        self.ids = count()
+        self.questions = {}  # id -> LocalQuestion still displayed
+        self.queries = 0
+
+    def ask(self, text, answers, priority=0, color="grey"):
+        question = LocalQuestion(self, next(self.ids), text, answers, priority, color)
+        self.questions[question.id] = question
+        return question
+
+    def answer(self, question, answer):
+        """
+        Answers a question as a user would do on the web page
+        :param question: the LocalQuestion or its id
+        """
+        question = self.questions[getattr(question, 'id', question)]
+        assert answer in question.answers, "{} is not an answer of '{}'".format(answer, question.text)
+        question.answer = answer
+
+    def get_answers(self, ids):
+        """
+        :return: dict id -> answer of the questions answered among ids
+        """
+        self.queries += 1
+        return dict((id, self.questions[id].answer) for id in ids
+                    if id in self.questions and self.questions[id].answer is not None)
+
+    def clear_all(self):
+        self.questions = {}
@@ -0,0 +1,130 @@
+import numpy as np
+
+# Joints used to associate the bodies of successive frames
+JOINTS = ['Head', 'WristLeft', 'WristRight']
+
+
+def joint_positions(skeleton, joints=JOINTS):
+    """
+    :return: array (len(joints), 3) of the positions of the joints in the camera frame, None if one is missing
+    """
+    try:
+        return np.array([[skeleton[joint]['Position'][axis] for axis in 'XYZ'] for joint in joints], dtype=float)
+    except (KeyError, TypeError):
+        return None
+
+
+def ros_to_kinect(position):
+    """
+    :param position: [x, y, z] position in a ROS frame located at the Kinect sensor (x forward, y left, z up)
+    :return: the same position in the camera space of the Kinect (X left, Y up, Z forward i.e. depth), in which the
+    joint positions of the skeletons are expressed
+    """
+    x, y, z = position
+    return [y, z, x]
+
+
+class Track(object):
+    def __init__(self, id, positions, stamp):
+        self.id = id
+        self.positions = positions
+        self.stamp = stamp
+        self.skeleton = None
+
+
+class SkeletonTracker(object):
+    """
+    Keeps all the bodies seen by the Kinect and associates them over frames by nearest neighbour on their head and
+    wrist positions, so that a body keeps its track id when the Kinect changes its body id.
+    The operator is the track closest to the table, it only changes when another track is closer by more than
+    `switch_margin` or when the operator is lost, so that bystanders walking by do not steal the interaction.
+    """
+    def __init__(self, table, max_distance=0.5, timeout=1., switch_margin=0.3):
+        """
+        :param table: [X, Y, Z] position of the table in the camera space of the Kinect (see ros_to_kinect)
+        :param max_distance: maximum mean joint distance in meters between two frames of a same body
+        :param timeout: time in seconds after which a track that is not seen anymore is dropped
+        """
+        self.table = np.array(table, dtype=float)
+        self.max_distance = max_distance
+        self.timeout = timeout
+        self.switch_margin = switch_margin
+        self.tracks = {}  # track id -> Track
+        self.next_id = 0
+        self.operator = None  # Track id of the operator
+
+    def associate(self, positions):
+        """
+        Greedy nearest neighbour assignment between the tracks and the bodies of a frame
+        :param positions: list of arrays of joint positions of the bodies
+        :return: dict body index -> track id
+        """
+        tracks = list(self.tracks.values())
+        if len(tracks) == 0 or len(positions) == 0:
+            return {}
+        # distances[t, b] is the mean distance between the joints of track t and of body b
+        distances = np.linalg.norm(np.array([t.positions for t in tracks])[:, None] - np.array(positions)[None],
+                                   axis=3).mean(axis=2)
+        assignment = {}
+        for flat in np.argsort(distances, axis=None):
+            t, b = np.unravel_index(flat, distances.shape)
+            if distances[t, b] > self.max_distance:
+                break
+            if b not in assignment and tracks[t].id not in assignment.values():
+                assignment[b] = tracks[t].id
+        return assignment
+
+    def update(self, skeletons, stamp):
+        """
+        :param skeletons: dict body id -> skeleton of a Kinect frame
+        :param stamp: time of the frame in seconds
+        :return: dict track id -> skeleton of the bodies of this frame
+        """
+        bodies = []
+        positions = []
+        for skeleton in skeletons.values():
+            body_positions = joint_positions(skeleton)
+            if body_positions is not None:
+                bodies.append(skeleton)
+                positions.append(body_positions)
+
+        assignment = self.associate(positions)
+        tracked = {}
+        for b, skeleton in enumerate(bodies):
+            if b in assignment:
+                track = self.tracks[assignment[b]]
+                track.positions, track.stamp = positions[b], stamp
+            else:
+                track = self.tracks[self.next_id] = Track(self.next_id, positions[b], stamp)
+                self.next_id += 1
+            track.skeleton = skeleton
+            tracked[track.id] = skeleton
+
+        for id in [id for id, track in self.tracks.items() if stamp - track.stamp > self.timeout]:
+            del self.tracks[id]
+        self.select_operator(tracked)
+        return tracked
+
+    def distance_to_table(self, track):
+        return np.linalg.norm(track.positions[0] - self.table)
+
+    def select_operator(self, tracked):
+        if len(tracked) == 0:
+            if self.operator not in self.tracks:
+                self.operator = None
+            return
+        closest = min(tracked, key=lambda id: self.distance_to_table(self.tracks[id]))
+        if self.operator not in tracked:
+            if self.operator not in self.tracks:
+                self.operator = closest
+        elif (self.distance_to_table(self.tracks[closest]) + self.switch_margin <
+                self.distance_to_table(self.tracks[self.operator])):
+            self.operator = closest
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        :param config: the 'tracker' section of thr_interaction_controller/config/gestures.json
+        """
+        return cls(config['table_position'], config['max_association_distance'], config['track_timeout'],
+                   config['operator_switch_margin'])
@@ -0,0 +1,76 @@
+from collections import OrderedDict
+from threading import Lock
+
+
+class SpeechCommandQueue(object):
+    """
+    Bounded queue of the spoken commands not processed yet.
+    A command repeated while it is still queued is collapsed into a single one, commands older than `max_age` are
+    dropped, and pop() returns the best one according to its confidence discounted by its age.
+    """
+    def __init__(self, size=5, max_age=5., on_command=None):
+        """
+        :param size: maximum number of commands queued, the worst one is dropped when full
+        :param max_age: time in seconds after which a command has expired
+        :param on_command: optional callable called without arguments each time a command is pushed
+        """
+        self.size = size
+        self.max_age = float(max_age)
+        self.on_command = on_command
+        self.lock = Lock()
+        self.commands = OrderedDict()  # semantics tuple -> (stamp, confidence), the oldest first
+        self.dropped = 0    # Commands dropped because the queue was full
+        self.expired = 0    # Commands dropped because they were too old
+        self.collapsed = 0  # Commands collapsed with a queued duplicate
+
+    def score(self, command, stamp):
+        command_stamp, confidence = self.commands[command]
+        return confidence * (1 - (stamp - command_stamp) / self.max_age)
+
+    def _expire(self, stamp):
+        while len(self.commands) > 0:
+            command, (command_stamp, confidence) = next(iter(self.commands.items()))
+            if stamp - command_stamp <= self.max_age:
+                break
+            del self.commands[command]
+            self.expired += 1
+
+    def push(self, semantics, stamp, confidence=1.):
+        """
+        :param semantics: the semantics of the command, e.g. ['start_hold', '/toolbox/handle']
+        :param stamp: time at which the command was heard, in seconds
+        :param confidence: confidence of the recognition in [0, 1]
+        """
+        command = tuple(semantics)
+        with self.lock:
+            self._expire(stamp)
+            previous = self.commands.pop(command, None)
+            if previous is not None:
+                confidence = max(confidence, previous[1])
+                self.collapsed += 1
+            self.commands[command] = (stamp, confidence)
+            if len(self.commands) > self.size:
+                del self.commands[min(self.commands, key=lambda c: self.score(c, stamp))]
+                self.dropped += 1
+        if callable(self.on_command):
+            self.on_command()
+
+    def pop(self, stamp):
+        """
+        :param stamp: current time in seconds
+        :return: the semantics tuple of the best command not expired and removes it from the queue, None if empty
+        """
+        with self.lock:
+            self._expire(stamp)
+            if len(self.commands) == 0:
+                return None
+            command = max(self.commands, key=lambda c: self.score(c, stamp))
+            del self.commands[command]
+            return command
+
+    def clear(self):
+        with self.lock:
+            self.commands.clear()
+
+    def __len__(self):
+        return len(self.commands)
@@ -2,11 +2,12 @@
 
 from pyFolWorld import FolWorld
 import rospy
+import uuid
 import rospkg
 from thr_infrastructure_msgs.srv import StartStopEpisode, StartStopEpisodeRequest, StartStopEpisodeResponse
 from thr_infrastructure_msgs.srv import GetNextDecision, GetNextDecisionRequest, GetNextDecisionResponse
 from thr_infrastructure_msgs.srv import SetNewTrainingExample, SetNewTrainingExampleRequest, SetNewTrainingExampleResponse
-from thr_infrastructure_msgs.msg import Decision, Predicate
+from thr_infrastructure_msgs.msg import Decision, Predicate, ModelVersion
 
 # To test this server, try: "rosservice call [/thr/learner or /thr/predictor] <TAB>"
 # and complete the pre-filled request message before <ENTER>
@@ -20,6 +21,12 @@ class Server(object):
         self.start_stop_service_name = '/thr/learner_predictor/start_stop'
         rospy.Service(self.start_stop_service_name, StartStopEpisode, self.cb_start_stop)
 
+        # Predictions only depend on the scene state, the version only changes when the node restarts
+        self.model_version_publisher = rospy.Publisher('/thr/predictor/model_version', ModelVersion, queue_size=1, latch=True)
+        model_version = ModelVersion(version=uuid.uuid4().hex[:8])
+        model_version.header.stamp = rospy.Time.now()
+        self.model_version_publisher.publish(model_version)
+
     def cb_start_stop(self, request):
         if request.command == StartStopEpisodeRequest.START:
             pass
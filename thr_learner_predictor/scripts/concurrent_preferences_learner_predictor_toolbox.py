@@ -6,7 +6,7 @@ import os
 import json
 import numpy as np
 
-from threading import Lock
+from threading import Lock, Thread
 
 from RBLT.domains import domain_dict
 from RBLT.learning import bagger
@@ -16,7 +16,7 @@ from RBLT import world
 from thr_infrastructure_msgs.srv import GetNextDecision, GetNextDecisionResponse,\
     StartStopEpisode, StartStopEpisodeRequest, StartStopEpisodeResponse
 from thr_infrastructure_msgs.srv import SetNewTrainingExample, SetNewTrainingExampleResponse
-from thr_infrastructure_msgs.msg import Decision, PredictedPlan
+from thr_infrastructure_msgs.msg import Decision, PredictedPlan, EpisodeProgress
 
 
 class Server(object):
@@ -66,6 +66,7 @@ class Server(object):
         rospy.Service(self.start_stop_service_name, StartStopEpisode, self.cb_start_stop)
 
         self.predicted_plan_publisher = rospy.Publisher('/thr/predicted_plan', PredictedPlan, queue_size=1)
+        self.episode_progress = rospy.Publisher('/thr/episode_progress', EpisodeProgress, queue_size=10)
 
         self.learn_preferences()
 
@@ -75,11 +76,29 @@ class Server(object):
 
         elif request.command == StartStopEpisodeRequest.STOP:
             self.predicted_plan_publisher.publish(PredictedPlan())
-            self.learn_preferences()
             self.i_episode += 1
+            # Retraining is long, the reply does not wait for it
+            Thread(target=self.learn_preferences_in_background).start()
+            return StartStopEpisodeResponse(background=['learning'])
 
         return StartStopEpisodeResponse()
 
+    def learn_preferences_in_background(self):
+        progress = EpisodeProgress(node='learner_predictor', command=StartStopEpisodeRequest.STOP, phase='learning')
+        progress.header.stamp = rospy.Time.now()
+        self.episode_progress.publish(progress)
+        try:
+            self.learn_preferences()
+        except Exception as e:
+            progress.error = "{}: {}".format(type(e).__name__, e)
+            rospy.logerr("Learning failed: {}".format(progress.error))
+            raise
+        finally:
+            # The interaction controller waits for this message before starting the next episode
+            progress.finished = True
+            progress.header.stamp = rospy.Time.now()
+            self.episode_progress.publish(progress)
+
     def learn_preferences(self):
         rospy.loginfo("Start learning")
         # tree_q_user = self.domain.learnRegressor(input_list, target_list, os.path.join(self.tmp_dir_name,
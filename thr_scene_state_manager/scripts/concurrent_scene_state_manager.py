@@ -1,12 +1,15 @@
 #!/usr/bin/env python
 
-import rospy, rospkg, tf, transformations
+import rospy, rospkg, tf
 from thr_infrastructure_msgs.srv import GetSceneState, GetSceneStateResponse, UpdateRelationalState, UpdateRelationalStateResponse,\
     UpdateRelationalStateRequest, StartStopEpisode, StartStopEpisodeRequest, StartStopEpisodeResponse
-from thr_infrastructure_msgs.msg import SceneState, Predicate, ActionHistoryEvent
+from thr_infrastructure_msgs.msg import SceneState, Predicate, ActionHistoryEvent, CompactSceneState, PredicateSchema
+from thr_scenes import SceneModel
+from thr_scene_state_manager import PredicateFilters, PoseFilter, FrameIndex, lookup_transform
 from itertools import combinations
 from threading import Lock
 import json
+import numpy as np
 from sensor_msgs.msg import Image
 from copy import deepcopy
 
@@ -21,6 +24,8 @@ class ConcurrentSceneStateManager(object):
         self.history_lock = Lock()
         self.persistent_predicates = []
         self.action_history_name = '/thr/action_history'
+        self.schema_name = '/thr/predicate_schema'
+        self.compact_state_name = '/thr/compact_scene_state'
         self.service_update_name = '/thr/update_relational_state'
         self.logs = []
         self.running = False
@@ -39,14 +44,21 @@ class ConcurrentSceneStateManager(object):
         self.scene = rospy.get_param('/thr/scene')
 
         self.rospack = rospkg.RosPack()
-        with open(self.rospack.get_path("thr_scenes")+"/config/"+self.scene+"/poses.json") as f:
-            self.poses = json.load(f)
-
-        with open(self.rospack.get_path("thr_scene_state_manager")+"/config/perception.json") as f:
-            self.config = json.load(f)
-
-        with open(self.rospack.get_path("thr_action_server")+"/config/abilities.json") as f:
-            self.abilities = json.load(f)
+        self.model = SceneModel.load(self.scene, self.objects, self.rospack)
+        self.config = self.model.perception
+        self.abilities = self.model.sides
+        self.in_human_ws_filters = PredicateFilters(self.config['in_human_ws'])
+        self.in_human_ws = set()  # Objects in the human workspace at the current tick
+        self.table = '/table'
+        self.pose_filter = PoseFilter(self.objects + [f for f in [self.table] if f not in self.objects],
+                                      self.config['pose_filter']['time_constant'], self.config['pose_filter']['max_age'])
+        self.frame_index = FrameIndex(self.pose_filter.frames, self.config['pose_filter']['max_age'])
+
+        # Predicate types and symbols are interned once for the scene, other nodes match predicates on these IDs
+        self.schema = self.model.schema
+        self.schema_pub = rospy.Publisher(self.schema_name, PredicateSchema, latch=True, queue_size=1)
+        self.compact_state_pub = rospy.Publisher(self.compact_state_name, CompactSceneState, latch=True, queue_size=1)
+        self.schema_pub.publish(self.schema.to_msg())
 
         self.tfl = tf.TransformListener(True, rospy.Duration(5*60)) # TF Interpolation ON and duration of its cache = 5 minutes
         self.image_pub = rospy.Publisher('/robot/xdisplay', Image, latch=True, queue_size=1)
@@ -60,6 +72,9 @@ class ConcurrentSceneStateManager(object):
         if request.command == StartStopEpisodeRequest.START:
             with self.state_lock:
                 self.persistent_predicates = []
+                self.in_human_ws_filters.reset()
+                self.pose_filter.reset()
+                self.frame_index.reset()
                 self.picked = []
                 self.at_home['left'] = True
                 self.at_home['right'] = True
@@ -69,6 +84,7 @@ class ConcurrentSceneStateManager(object):
 
         elif request.command == StartStopEpisodeRequest.STOP:
             self.running = False
+            rospy.loginfo("[SceneStateManager] {}".format(self.frame_index.report()))
         return StartStopEpisodeResponse()
 
     def cb_update_relational_state(self, request):
@@ -140,13 +156,41 @@ class ConcurrentSceneStateManager(object):
                 self.logs.append({'timestamp': rospy.get_time(),
                                   'scene': predicates })
                 self.old_state = deepcopy(self.state)
+                self.publish_compact_state()
+
+    def publish_compact_state(self):
+        """
+        Publishes the current state with interned predicates, the schema is published again first if it has grown
+        """
+        revision = self.schema.revision
+        compact_state = self.schema.encode_state(self.state, intern=True)
+        if self.schema.revision != revision:
+            self.schema_pub.publish(self.schema.to_msg())
+        self.compact_state_pub.publish(compact_state)
+
+    def lookup(self, frame):
+        return lookup_transform(self.tfl, self.world, frame)
+
+    def update_in_human_ws(self):
+        """
+        Evaluates IN_HUMAN_WS of all objects at once on their filtered poses: objects and table must have been seen
+        during the last in_human_ws_time seconds. Debounced, objects enter the human workspace closer than
+        in_human_ws_distance to the table and leave it further than exit_distance
+        """
+        config = self.config['in_human_ws']
+        stamp = rospy.get_time()
+        self.pose_filter.measure(self.lookup, stamp, self.frame_index.available(stamp))
+        fresh = self.pose_filter.fresh_since(stamp, config['in_human_ws_time'])
+        table = self.pose_filter.index[self.table]
+        recent = fresh[:len(self.objects)] & fresh[table]
+        distances = np.linalg.norm(self.pose_filter.positions[:len(self.objects)] - self.pose_filter.positions[table], axis=1)
+        entering = recent & (distances < config['in_human_ws_distance'])
+        staying = recent & (distances < config['exit_distance'])
+        self.in_human_ws = set(obj for i, obj in enumerate(self.objects)
+                               if self.in_human_ws_filters.update(obj, entering[i], staying[i], stamp))
 
     def pred_in_human_ws(self, obj):
-        try:
-            return rospy.Time.now() - self.tfl.getLatestCommonTime(obj, "/table") < rospy.Duration(self.config['in_human_ws']['in_human_ws_time']) \
-                    and transformations.norm(self.tfl.lookupTransform(obj, "/table", rospy.Time(0)))<self.config['in_human_ws']['in_human_ws_distance']
-        except:
-            return False
+        return obj in self.in_human_ws
 
     def cb_scene_state(self, req):
         with self.state_lock:
@@ -158,6 +202,7 @@ class ConcurrentSceneStateManager(object):
                 with self.state_lock:
                     self.state.predicates = [] + self.persistent_predicates
                     self.state.header.stamp = rospy.Time.now()
+                    self.update_in_human_ws()
                     for o in self.objects:
                         if self.pred_in_human_ws(o):
                             p = Predicate()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+"""
+Measures the per-tick cost of the scene state updater against the number of objects of a synthetic scene, offline:
+each object is the master of the next two ones at 2 attach points, half of them with a screwdriver, and the
+transforms are read from a dictionary instead of TF.
+The 'pruning' column is the cost of the former candidate pair selection alone, iterating on all pairs of objects and
+attach points and skipping those without constraint, the 'tick' column the full evaluation of the constraints.
+"""
+import argparse
+import json
+import random
+import rospkg
+from itertools import product
+from timeit import default_timer as timer
+from thr_scenes import SceneModel
+from thr_scene_state_manager import ConstraintEvaluator
+
+IDENTITY = [[0., 0., 0.], [0., 0., 0., 1.]]
+
+
+def synthetic_poses(objects, tool):
+    poses = {}
+    for i, master in enumerate(objects):
+        constraints = [{}, {}]
+        for j, slave in enumerate(objects[i + 1:i + 3]):
+            for atp, constraint in enumerate(constraints):
+                constraint[slave] = [[0.1 * (j + 1), 0.05 * atp, 0.], [0., 0., 0., 1.]]
+                if (i + atp) % 2 == 0:
+                    constraint[tool] = [[0., 0.05 * atp, 0.1], [0., 0., 0., 1.]]
+        poses[master] = {'constraints': constraints}
+    return poses
+
+
+def legacy_pruning(objects, poses):
+    """
+    :return: the number of triples having a constraint, selected as the scene state updater used to
+    """
+    triples = 0
+    for master, slave, atp in product(objects, objects, [0, 1]):
+        if not ('constraints' in poses[master] and len([c for c in poses[master]['constraints'] if slave in c]) > 0):
+            continue
+        triples += 1
+    return triples
+
+
+def benchmark(num_objects, perception, ticks, seed=0):
+    rng = random.Random(seed)
+    tool = '/tools/screwdriver'
+    objects = ['/bench/object_{}'.format(i) for i in range(num_objects)]
+    poses = synthetic_poses(objects, tool)
+    model = SceneModel('bench', objects, poses, {}, perception, {}, {})
+    constraints = ConstraintEvaluator(model)
+    transforms = dict((frame, [[rng.uniform(-0.5, 0.5) for axis in range(3)], [0., 0., 0., 1.]])
+                      for frame in constraints.frames)
+    transforms[objects[0]] = IDENTITY
+    transforms[objects[1]] = [[0.1, 0., 0.], [0., 0., 0., 1.]]  # Positioned on the first object
+    lookups = [0]
+    clock = [0.]
+
+    def lookup(frame):
+        lookups[0] += 1
+        return transforms[frame], clock[0]
+
+    start = timer()
+    for tick in range(ticks):
+        legacy_pruning(objects, poses)
+    pruning = (timer() - start) / ticks
+
+    start = timer()
+    for tick in range(ticks):
+        clock[0] = 0.05 * tick
+        constraints.snapshot(lookup, clock[0])
+        constraints.update(clock[0])
+    elapsed = (timer() - start) / ticks
+    return len(constraints.triples), pruning, elapsed, float(lookups[0]) / ticks
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--objects', type=int, nargs='+', default=[5, 10, 20, 40, 80], help="numbers of objects")
+    parser.add_argument('--ticks', type=int, default=200, help="number of ticks measured per scene")
+    args = parser.parse_args()
+
+    with open(rospkg.RosPack().get_path("thr_scene_state_manager") + "/config/perception.json") as f:
+        perception = json.load(f)
+    print("{:>8} {:>8} {:>12} {:>12} {:>14}".format("objects", "triples", "pruning(us)", "tick(us)", "lookups/tick"))
+    for num_objects in args.objects:
+        triples, pruning, elapsed, lookups = benchmark(num_objects, perception, args.ticks)
+        print("{:>8} {:>8} {:>12.1f} {:>12.1f} {:>14.1f}".format(num_objects, triples, 1e6 * pruning, 1e6 * elapsed, lookups))
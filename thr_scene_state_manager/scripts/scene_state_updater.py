@@ -0,0 +1,8 @@
+#!/usr/bin/env python
+
+import rospy
+from thr_scene_state_manager import SceneStateUpdater
+
+if __name__ == '__main__':
+    rospy.init_node('scene_state_updater')
+    SceneStateUpdater(20).run()
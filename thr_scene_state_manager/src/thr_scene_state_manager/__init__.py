@@ -0,0 +1,5 @@
+from . updater import SceneStateUpdater
+from . constraints import ConstraintEvaluator
+from . filters import HysteresisFilter, PredicateFilters
+from . poses import PoseFilter
+from . frames import FrameIndex, lookup_transform
@@ -0,0 +1,234 @@
+import transformations
+from . filters import PredicateFilters
+from . poses import PoseFilter
+
+
+class AttachMachine(object):
+    """
+    Attaching of a slave on a master at an attach point with a tool (e.g. screwing with the screwdriver):
+    - IDLE -> POSITIONED when the slave is positioned
+    - POSITIONED -> TOOLING when a tool comes closer than the tool position tolerance
+    - TOOLING -> TOOLED once the tool stayed close for the attaching time
+    - TOOLED -> ATTACHED when the tool goes further than the tool release tolerance
+    - TOOLING -> POSITIONED if the tool has been away for more than the interruption time, the timer restarts
+    - Any state but ATTACHED -> IDLE if the slave has not been positioned for more than the interruption time
+    ATTACHED is final until reset().
+    """
+    IDLE, POSITIONED, TOOLING, TOOLED, ATTACHED = range(5)
+    NAMES = ['idle', 'positioned', 'tooling', 'tooled', 'attached']
+
+    def __init__(self, config):
+        """
+        :param config: the 'attached' section of perception.json
+        """
+        self.enter = config['tool_position_tolerance']
+        self.release = config['tool_release_tolerance']
+        self.attaching_time = config['screwdriver_attaching_time']
+        self.interruption_time = config['interruption_time']
+        self.reset()
+
+    def reset(self):
+        self.state = self.IDLE
+        self.tool_since = None  # Time at which the tool came close
+        self.tool_away = None   # Time at which the tool went away while tooling
+        self.lost = None        # Time at which the slave stopped being positioned
+
+    def tool_close(self, distance):
+        """
+        :param distance: cartesian distance of the closest tool to its constraint, None if no tool is available
+        """
+        if distance is None:
+            return False
+        return distance < (self.release if self.state in (self.TOOLING, self.TOOLED) else self.enter)
+
+    def advance(self, positioned, tool_distance, stamp):
+        """
+        :param positioned: True if the slave is positioned on the master
+        :param tool_distance: cartesian distance of the closest tool to its constraint, None if no tool is available
+        :param stamp: time of the tick in seconds
+        :return: the new state
+        """
+        if self.state == self.ATTACHED:
+            return self.state
+        if not positioned:
+            if self.state != self.IDLE:
+                self.lost = stamp if self.lost is None else self.lost
+                if stamp - self.lost > self.interruption_time:
+                    self.reset()
+            return self.state
+        self.lost = None
+        close = self.tool_close(tool_distance)
+
+        if self.state == self.IDLE:
+            self.state = self.POSITIONED
+        if self.state == self.POSITIONED:
+            if close:
+                self.state, self.tool_since, self.tool_away = self.TOOLING, stamp, None
+        elif self.state == self.TOOLING:
+            if close:
+                self.tool_away = None
+                if stamp - self.tool_since > self.attaching_time:
+                    self.state = self.TOOLED
+            else:
+                self.tool_away = stamp if self.tool_away is None else self.tool_away
+                if stamp - self.tool_away > self.interruption_time:
+                    self.state, self.tool_since, self.tool_away = self.POSITIONED, None, None
+        elif self.state == self.TOOLED and not close:
+            self.state = self.ATTACHED
+        return self.state
+
+    def __repr__(self):
+        return self.NAMES[self.state]
+
+
+class ConstraintEvaluator(object):
+    """
+    Geometric predicates (positioned, attached) and human activities (position, screw) of the constraints of a
+    SceneModel, evaluated for the (master, slave, atp) triples having a constraint only.
+    Transforms are looked up once per tick and per frame in snapshot() and smoothed by a PoseFilter, so that the
+    predicates of a tick are all evaluated on the same filtered poses, frames that are not fresh being unavailable.
+    Positioned and position are debounced by the hysteresis filters configured in their section of perception.json.
+    Constraints with tools are attached by an AttachMachine each, only the machines that are not idle or attached
+    are advanced at each tick besides the ones of positioned triples.
+    """
+    def __init__(self, model):
+        """
+        :param model: the thr_scenes.SceneModel of the scene
+        """
+        self.model = model
+        self.config = model.perception
+        self.triples = list(model.constraint_triples)  # (master, slave, atp) to evaluate at each tick
+        self.tools = model.tool_constraints            # (master, atp) -> tools attaching there
+        frames = set()
+        for master, slave, atp in self.triples:
+            frames.update([master, slave])
+            frames.update(self.tools.get((master, atp), {}))
+        self.frames = sorted(frames)  # Frames looked up at each tick
+        self.poses = PoseFilter(self.frames, self.config['pose_filter']['time_constant'],
+                                self.config['pose_filter']['max_age'])
+        self.transforms = {}  # frame -> world transform of the current tick, missing if not fresh
+        self.inverses = {}    # master -> inverse world transform of the current tick
+        self.distances_cache = {}  # (master, frame, atp) -> distances of the current tick
+        self.positioned_filters = PredicateFilters(self.config['positioned'])
+        self.position_filters = PredicateFilters(self.config['start_position'])
+        self.reset()
+
+    def reset(self):
+        self.machines = dict((triple, AttachMachine(self.config['attached'])) for triple in self.triples
+                             if (triple[0], triple[2]) in self.tools)  # (master, slave, atp) -> AttachMachine
+        self.active = set()    # (master, slave, atp) of the machines neither idle nor attached
+        self.attached = set()  # (master, slave, atp) attached together, they stay attached until reset
+        self.positioning = set()  # (master, slave, atp) being positioned at the current tick
+        self.poses.reset()
+        self.positioned_filters.reset()
+        self.position_filters.reset()
+
+    def snapshot(self, lookup, stamp, available=None):
+        """
+        Looks up the world transforms of all frames for a new tick
+        :param lookup: callable frame -> (world transform [position, quaternion], time of the transform in seconds),
+        or None if the lookup failed
+        :param stamp: time of the tick in seconds
+        :param available: boolean mask of the frames to look up in the order of self.frames, None to look up all of them
+        """
+        fresh = self.poses.measure(lookup, stamp, available)
+        self.transforms = dict((frame, self.poses.pose(frame)) for frame, is_fresh in zip(self.frames, fresh) if is_fresh)
+        self.inverses = {}
+        self.distances_cache = {}
+
+    def distances(self, master, frame, atp):
+        """
+        :return: the (cartesian, angular) distances between the constraint master->frame at attach point atp and the
+        transform master->frame of the snapshot, None if one of these frames is not available
+        """
+        key = (master, frame, atp)
+        if key not in self.distances_cache:
+            if master not in self.transforms or frame not in self.transforms:
+                self.distances_cache[key] = None
+            else:
+                if master not in self.inverses:
+                    self.inverses[master] = transformations.inverse_transform(self.transforms[master])
+                relative = transformations.multiply_transform(self.inverses[master], self.transforms[frame])
+                constraint = self.model.constraint(master, frame, atp)
+                self.distances_cache[key] = (transformations.distance(constraint, relative),
+                                             transformations.distance_quat(constraint, relative))
+        return self.distances_cache[key]
+
+    def within(self, distances, tolerances, exit=False):
+        """
+        :param tolerances: a section of perception.json with a position_tolerance and an orientation_tolerance
+        :param exit: True to use the exit_position_tolerance and exit_orientation_tolerance instead
+        """
+        prefix = 'exit_' if exit else ''
+        return (distances is not None and distances[0] < tolerances[prefix + 'position_tolerance'] and
+                distances[1] < tolerances[prefix + 'orientation_tolerance'])
+
+    def filter(self, filters, triple, tolerances, stamp):
+        """
+        :return: the debounced value of a predicate family that is True when the distances of triple are within the
+        tolerances
+        """
+        distances = self.distances(*triple)
+        return filters.update(triple, self.within(distances, tolerances), self.within(distances, tolerances, True), stamp)
+
+    def tool_distance(self, master, atp):
+        """
+        :return: the cartesian distance of the closest tool attaching at attach point atp of master to its constraint,
+        None if none is available. Orientation is not measured, since tools such as the screwdriver have to spin
+        """
+        closest = None
+        for tool in self.tools.get((master, atp), {}):
+            distances = self.distances(master, tool, atp)
+            if distances is not None and (closest is None or distances[0] < closest):
+                closest = distances[0]
+        return closest
+
+    def screwing(self, master, slave, atp):
+        """
+        :return: True if a tool is at work to attach slave on master at attach point atp
+        """
+        machine = self.machines.get((master, slave, atp))
+        return machine is not None and machine.state in (AttachMachine.TOOLING, AttachMachine.TOOLED)
+
+    def position(self, master, slave, atp):
+        """
+        :return: True if slave is being positioned on master at attach point atp (close but not positioned yet)
+        """
+        return (master, slave, atp) in self.positioning
+
+    def update(self, stamp):
+        """
+        Evaluates all constraints on the current snapshot
+        :param stamp: time of the tick in seconds
+        :return: the set of (type, (master, slave, atp)) of the positioned and attached predicates that are True
+        """
+        predicates = set()
+        for triple in self.triples:
+            if triple in self.attached:
+                predicates.add(('positioned', triple))
+                predicates.add(('attached', triple))
+                self.positioning.discard(triple)
+                continue
+            positioned = self.filter(self.positioned_filters, triple, self.config['positioned'], stamp)
+            if positioned:
+                predicates.add(('positioned', triple))
+            if self.filter(self.position_filters, triple, self.config['start_position'], stamp) and not positioned:
+                self.positioning.add(triple)
+            else:
+                self.positioning.discard(triple)
+            machine = self.machines.get(triple)
+            if machine is None:  # For objects that only need to be inserted
+                if positioned:
+                    self.attached.add(triple)
+                    predicates.add(('attached', triple))
+            elif positioned or triple in self.active:  # For objects that need to be screwed
+                state = machine.advance(positioned, self.tool_distance(triple[0], triple[2]) if positioned else None, stamp)
+                if state == AttachMachine.ATTACHED:
+                    self.active.discard(triple)
+                    self.attached.add(triple)
+                    predicates.add(('attached', triple))
+                elif state == AttachMachine.IDLE:
+                    self.active.discard(triple)
+                else:
+                    self.active.add(triple)
+        return predicates
@@ -0,0 +1,54 @@
+class HysteresisFilter(object):
+    """
+    Debounced boolean predicate: it becomes True once the measure has been within the enter thresholds for
+    `enter_time` seconds and False once it has been out of the exit thresholds, wider, for `exit_time` seconds.
+    Jitter of the measure around a threshold thus does not flip the predicate.
+    """
+    def __init__(self, enter_time=0., exit_time=0.):
+        self.enter_time = enter_time
+        self.exit_time = exit_time
+        self.value = False
+        self.since = None  # Time since which the measure disagrees with the value
+
+    def update(self, entering, staying, stamp):
+        """
+        :param entering: True if the measure is within the enter thresholds
+        :param staying: True if the measure is within the exit thresholds
+        :param stamp: time of the measure in seconds
+        :return: the filtered value
+        """
+        if (staying if self.value else entering) == self.value:
+            self.since = None
+        else:
+            self.since = stamp if self.since is None else self.since
+            if stamp - self.since >= (self.exit_time if self.value else self.enter_time):
+                self.value = not self.value
+                self.since = None
+        return self.value
+
+
+class PredicateFilters(object):
+    """
+    HysteresisFilters of the predicates of a family (e.g. all positioned(master, slave, atp)), created on first use.
+    Dwell times are read from the section of the family in perception.json.
+    """
+    def __init__(self, config):
+        """
+        :param config: the section of the family in perception.json, with an enter_time and an exit_time
+        """
+        self.enter_time = config['enter_time']
+        self.exit_time = config['exit_time']
+        self.filters = {}  # parameters -> HysteresisFilter
+
+    def update(self, parameters, entering, staying, stamp):
+        """
+        :param parameters: hashable parameters of the predicate, e.g. (master, slave, atp)
+        :return: the filtered value of the predicate
+        """
+        predicate_filter = self.filters.get(parameters)
+        if predicate_filter is None:
+            predicate_filter = self.filters[parameters] = HysteresisFilter(self.enter_time, self.exit_time)
+        return predicate_filter.update(entering, staying, stamp)
+
+    def reset(self):
+        self.filters = {}
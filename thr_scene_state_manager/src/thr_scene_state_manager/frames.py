@@ -0,0 +1,75 @@
+import rospy
+import tf
+import numpy as np
+from tf2_msgs.msg import TFMessage
+
+
+def lookup_transform(tfl, world, frame):
+    """
+    Looks up the last transform of a frame, e.g. one that a FrameIndex reports available
+    :param tfl: the tf.TransformListener
+    :param world: name of the reference frame
+    :return: the last transform world->frame [position, quaternion] and its time in seconds, None if TF cannot provide it
+    """
+    # WARNING: Do not ask the relative tf directly, it is outdated!
+    try:
+        stamp = tfl.getLatestCommonTime(world, frame)
+        # The chain of a frame only published on /tf_static has no time (0), it is valid now
+        return tfl.lookupTransform(world, frame, stamp), stamp.to_sec() or rospy.get_time()
+    except tf.Exception as e:
+        rospy.logwarn_throttle(10, "Frame {} is published but cannot be looked up: {}".format(frame, e))
+        return None
+
+
+class FrameIndex(object):
+    """
+    Last time each frame of interest has been published on /tf, so that the frames out of view (e.g. objects hidden
+    from the motion capture) are skipped before any TF lookup instead of raising and catching TF exceptions for each
+    of them at each tick. Frames published on /tf_static are always available.
+    Counts for each frame the number of checks for which it was stale.
+    """
+    def __init__(self, frames, max_age=1., listen=True):
+        """
+        :param frames: names of the frames to index
+        :param max_age: time in seconds after which a frame that is not published anymore is stale
+        :param listen: True to subscribe to /tf and /tf_static, otherwise cb_tf() must be called with the messages
+        """
+        self.frames = list(frames)
+        self.names = [frame.lstrip('/') for frame in self.frames]  # TF2 publishes frame ids without leading slash
+        self.max_age = max_age
+        self.last_seen = {}  # frame id without leading slash -> time of its last transform in seconds
+        self.reset()
+        if listen:
+            rospy.Subscriber('/tf', TFMessage, self.cb_tf)
+            rospy.Subscriber('/tf_static', TFMessage, self.cb_tf_static)
+
+    def reset(self):
+        self.stale = dict((frame, 0) for frame in self.frames)  # frame -> number of checks for which it was stale
+        self.checks = 0
+
+    def cb_tf(self, msg):
+        for transform in msg.transforms:
+            self.last_seen[transform.child_frame_id.lstrip('/')] = transform.header.stamp.to_sec()
+
+    def cb_tf_static(self, msg):
+        for transform in msg.transforms:
+            self.last_seen[transform.child_frame_id.lstrip('/')] = float('inf')
+
+    def available(self, stamp):
+        """
+        :param stamp: current time in seconds
+        :return: boolean mask of the frames published during the last max_age seconds, in the order of self.frames
+        """
+        last_seen = np.array([self.last_seen.get(name, -np.inf) for name in self.names])
+        mask = stamp - last_seen <= self.max_age
+        self.checks += 1
+        for i in np.flatnonzero(~mask):
+            self.stale[self.frames[i]] += 1
+        return mask
+
+    def report(self):
+        """
+        :return: a description of the frames that have been stale, e.g. for logs at the end of an episode
+        """
+        stale = ['{} {}/{}'.format(frame, count, self.checks) for frame, count in sorted(self.stale.items()) if count > 0]
+        return 'stale frames: ' + (', '.join(stale) if len(stale) > 0 else 'none')
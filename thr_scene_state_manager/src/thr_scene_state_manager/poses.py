@@ -0,0 +1,97 @@
+import numpy as np
+
+
+class PoseFilter(object):
+    """
+    Exponential smoothing of the world poses of a fixed set of frames (tracked objects, tools, table...), all updated
+    at once with NumPy: positions are smoothed linearly and orientations by normalized quaternion interpolation,
+    with a weight 1 - exp(-dt / time_constant) given to each new measure received dt seconds after the previous one.
+    The validity mask tells which frames have been measured at least once, the freshness mask which ones have been
+    measured during the last `max_age` seconds, so that consumers test masks instead of catching lookup exceptions.
+    """
+    def __init__(self, frames, time_constant=0.05, max_age=1.):
+        """
+        :param frames: names of the frames to filter
+        :param time_constant: time constant of the smoothing in seconds, 0 to disable it
+        :param max_age: time in seconds after which the pose of a frame that is not measured anymore is not fresh
+        """
+        self.frames = list(frames)
+        self.index = dict((frame, i) for i, frame in enumerate(self.frames))  # frame -> row
+        self.time_constant = time_constant
+        self.max_age = max_age
+        self.reset()
+
+    def reset(self):
+        num_frames = len(self.frames)
+        self.positions = np.zeros((num_frames, 3))
+        self.orientations = np.tile([0., 0., 0., 1.], (num_frames, 1))
+        self.stamps = np.full(num_frames, -np.inf)  # Time of the last measure of each frame
+        self.valid = np.zeros(num_frames, dtype=bool)
+        self.fresh = np.zeros(num_frames, dtype=bool)
+
+    def update(self, positions, orientations, stamps, measured, stamp):
+        """
+        :param positions: (N, 3) array of the measured positions, in the order of self.frames
+        :param orientations: (N, 4) array of the measured quaternions [x, y, z, w]
+        :param stamps: (N, ) array of the times of the measures in seconds
+        :param measured: (N, ) boolean mask of the frames measured, the rows of the others are ignored
+        :param stamp: current time in seconds
+        :return: the freshness mask
+        """
+        new = measured & (stamps > self.stamps)  # Measures already filtered are not counted twice
+        first = new & ~self.valid
+        smooth = new & self.valid
+        if smooth.any():
+            if self.time_constant > 0:
+                alpha = (1 - np.exp(-(stamps[smooth] - self.stamps[smooth]) / self.time_constant))[:, None]
+            else:
+                alpha = np.ones((smooth.sum(), 1))
+            self.positions[smooth] += alpha * (positions[smooth] - self.positions[smooth])
+            previous = self.orientations[smooth]
+            measures = orientations[smooth]
+            measures = np.where((np.sum(previous * measures, axis=1) < 0)[:, None], -measures, measures)  # Shortest path
+            interpolated = previous + alpha * (measures - previous)
+            self.orientations[smooth] = interpolated / np.linalg.norm(interpolated, axis=1)[:, None]
+        self.positions[first] = positions[first]
+        self.orientations[first] = orientations[first]
+        self.stamps[new] = stamps[new]
+        self.valid |= new
+        self.fresh = self.fresh_since(stamp, self.max_age)
+        return self.fresh
+
+    def measure(self, lookup, stamp, available=None):
+        """
+        Looks up the available frames and updates the filter with the new measures
+        :param lookup: callable frame -> (world transform [position, quaternion], time of the transform in seconds),
+        or None if the lookup failed
+        :param stamp: current time in seconds
+        :param available: boolean mask of the frames to look up, e.g. from a FrameIndex, None to look up all frames
+        :return: the freshness mask
+        """
+        num_frames = len(self.frames)
+        positions = np.zeros((num_frames, 3))
+        orientations = np.zeros((num_frames, 4))
+        stamps = np.zeros(num_frames)
+        measured = np.zeros(num_frames, dtype=bool)
+        for i in (range(num_frames) if available is None else np.flatnonzero(available)):
+            measure = lookup(self.frames[i])
+            if measure is not None:
+                (positions[i], orientations[i]), stamps[i] = measure
+                measured[i] = True
+        return self.update(positions, orientations, stamps, measured, stamp)
+
+    def fresh_since(self, stamp, max_age):
+        """
+        :return: the mask of the frames measured during the last max_age seconds
+        """
+        return self.valid & (stamp - self.stamps <= max_age)
+
+    def is_fresh(self, frame):
+        return self.fresh[self.index[frame]]
+
+    def pose(self, frame):
+        """
+        :return: the filtered world transform of frame as [position, quaternion] lists, as returned by TF
+        """
+        i = self.index[frame]
+        return [self.positions[i].tolist(), self.orientations[i].tolist()]
@@ -0,0 +1,150 @@
+import rospy
+import rospkg
+import tf
+from thr_infrastructure_msgs.msg import Predicate, ActionHistoryEvent, Decision
+from thr_infrastructure_msgs.srv import UpdateRelationalState, UpdateRelationalStateRequest
+from thr_infrastructure_msgs.srv import StartStopEpisode, StartStopEpisodeRequest, StartStopEpisodeResponse
+from thr_scenes import SceneModel
+from . constraints import ConstraintEvaluator
+from . frames import FrameIndex, lookup_transform
+
+
+class SceneStateUpdater(object):
+    """
+    Scene state updater of any scene, generating the geometric predicates from the constraints of its poses.json:
+    - POSITIONED(master, slave, atp) when slave matches the constraint of master at attach point atp
+    - ATTACHED(master, slave, atp) when positioned and, if master has tool constraints at atp (e.g. the screwdriver),
+      once one of these tools has been close to master for attaching_time and has left (see AttachMachine),
+      otherwise as soon as positioned
+    And the matching human activities 'position' (slave close to the constraint) and 'screw' (tool at work).
+    Constraints are evaluated by a ConstraintEvaluator, on transforms looked up once per tick.
+    """
+    def __init__(self, rate):
+        self.rate = rate
+        self.world = 'base'
+        self.service_update = '/thr/update_relational_state'
+        self.action_history_name = '/thr/action_history'
+
+        self.tfl = tf.TransformListener()
+        rospy.wait_for_service(self.service_update)
+        self.update_relational_state = rospy.ServiceProxy(self.service_update, UpdateRelationalState)
+        self.running_human_activity = None
+
+        self.old_predicates = set()  # (type, (master, slave, atp)) of the predicates sent to the scene state manager
+
+        self.scene = rospy.get_param('/thr/scene')
+        self.rospack = rospkg.RosPack()
+        self.objects = rospy.get_param('/thr/objects')[self.scene]
+        self.running = False
+
+        self.start_stop_service_name = '/thr/scene_state_updater/start_stop'
+        rospy.Service(self.start_stop_service_name, StartStopEpisode, self.cb_start_stop)
+        self.action_history = rospy.Publisher(self.action_history_name, ActionHistoryEvent, queue_size=10)
+
+        self.model = SceneModel.load(self.scene, self.objects, self.rospack)
+        self.constraints = ConstraintEvaluator(self.model)
+        self.frame_index = FrameIndex(self.constraints.frames, self.model.perception['pose_filter']['max_age'])
+        rospy.loginfo("Scene state updater of scene {}: {} constraints between {} frames".format(
+            self.scene, len(self.constraints.triples), len(self.constraints.frames)))
+
+    def cb_start_stop(self, request):
+        if request.command == StartStopEpisodeRequest.START:
+            self.running_human_activity = None
+            self.old_predicates = set()
+            self.constraints.reset()
+            self.frame_index.reset()
+            self.running = True
+
+        elif request.command == StartStopEpisodeRequest.STOP:
+            self.running = False
+            rospy.loginfo("Scene state updater {}".format(self.frame_index.report()))
+        return StartStopEpisodeResponse()
+
+    def lookup(self, frame):
+        return lookup_transform(self.tfl, self.world, frame)
+
+    def pred_position(self, master, slave, atp):
+        return self.constraints.position(master, slave, atp)
+
+    def pred_screw(self, master, slave, atp):
+        return self.constraints.screwing(master, slave, atp)
+
+    def check_new_activity_predicate(self, master, slave, atp):
+        """
+        Generate the predicate related to human activities, if no one is already known to the SSU
+        We consider that human is not threaded so only 1 predicate can be generated here
+        """
+        if self.running_human_activity is None:
+            predicate = Predicate()
+            if self.pred_position(master, slave, atp):
+                predicate.type = 'position'
+                predicate.parameters = [master, slave, str(atp), "eq1"]
+            elif self.pred_screw(master, slave, atp):
+                predicate.type = 'screw'
+                predicate.parameters = [master, slave, str(atp), "eq1"]
+
+            if predicate.type != '':
+                self.running_human_activity = predicate
+                self.add_predicate(predicate)
+
+                # Human has no action server so he can't publish its action history, we do this now
+                event = ActionHistoryEvent()
+                event.header.stamp = rospy.Time.now()
+                event.type = ActionHistoryEvent.STARTING
+                event.action = Decision(type="start_" + self.running_human_activity.type,
+                                        parameters=self.running_human_activity.parameters[:-1])
+                event.side = 'human'
+                self.action_history.publish(event)
+
+    def check_ended_human_activity(self):
+        """
+        If the SSU knows a running human activity, check that it's still active and disable it if not
+        """
+        if self.running_human_activity is not None:
+            master, slave, atp = self.running_human_activity.parameters[:3]
+            if self.running_human_activity.type == 'position':
+                still_running = self.pred_position(master, slave, int(atp))
+            else:
+                still_running = self.pred_screw(master, slave, int(atp))
+
+            if not still_running:
+                self.remove_predicate(self.running_human_activity)
+                self.running_human_activity = None
+
+    def add_predicate(self, predicate):
+        request = UpdateRelationalStateRequest(command=UpdateRelationalStateRequest.ADD, predicate=predicate)
+        reply = self.update_relational_state(request)
+        if not reply.success:
+            rospy.logerr('SSU failed to add {}{}'.format(predicate.type, str(predicate.parameters)))
+
+    def remove_predicate(self, predicate):
+        request = UpdateRelationalStateRequest(command=UpdateRelationalStateRequest.REMOVE, predicate=predicate)
+        reply = self.update_relational_state(request)
+        if not reply.success:
+            rospy.logerr('SSU failed to remove {}{}'.format(predicate.type, str(predicate.parameters)))
+
+    def update(self):
+        """
+        Evaluates all constraints once and updates the predicates of the scene state manager that changed
+        """
+        stamp = rospy.get_time()
+        self.constraints.snapshot(self.lookup, stamp, self.frame_index.available(stamp))
+        current_predicates = self.constraints.update(stamp)
+
+        # Update the Human Activities that could be performed on these objects
+        for master, slave, atp in self.constraints.triples:
+            self.check_new_activity_predicate(master, slave, atp)
+        self.check_ended_human_activity()
+
+        for type, (master, slave, atp) in sorted(current_predicates - self.old_predicates):
+            self.add_predicate(Predicate(type=type, parameters=[master, slave, str(atp)]))
+        for type, (master, slave, atp) in sorted(self.old_predicates - current_predicates):
+            self.remove_predicate(Predicate(type=type, parameters=[master, slave, str(atp)]))
+        self.old_predicates = current_predicates
+
+    def run(self):
+        rate = rospy.Rate(self.rate)
+        while not rospy.is_shutdown():
+            if self.running:
+                self.update()
+            rate.sleep()
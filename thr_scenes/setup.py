@@ -0,0 +1,7 @@
+#!/usr/bin/env python
+from distutils.core import setup
+from catkin_pkg.python_setup import generate_distutils_setup
+d = generate_distutils_setup()
+d['packages'] = ['thr_scenes']
+d['package_dir'] = {'': 'src'}
+setup(**d)
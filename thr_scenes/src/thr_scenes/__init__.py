@@ -0,0 +1,2 @@
+from . predicates import PredicateSchema
+from . scene_model import SceneModel
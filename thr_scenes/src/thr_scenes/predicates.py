@@ -0,0 +1,118 @@
+from thr_infrastructure_msgs.msg import Predicate, SceneState, CompactPredicate, CompactSceneState, PredicateSchema as PredicateSchemaMsg
+
+# Predicate types generated by the scene state manager and the scene state updaters
+GENERIC_TYPES = ['in_human_ws', 'picked', 'busy', 'at_home', 'positioned', 'attached', 'position', 'screw']
+# Agents and activity encodings appearing as predicate parameters
+GENERIC_SYMBOLS = ['left', 'right', 'human', 'eq1', 'eq2']
+
+
+class PredicateSchema(object):
+    """
+    Interning table of predicate types and symbols shared by all nodes of a scene.
+    The scene state manager owns the table and publishes it, other nodes receive it and match predicates on integer IDs.
+    decode() and decode_state() convert back to Predicate/SceneState for legacy string consumers.
+    """
+    def __init__(self, scene='', types=(), symbols=(), revision=0):
+        self.scene = scene
+        self.revision = revision
+        self.types = []
+        self.symbols = []
+        self.type_ids = {}
+        self.symbol_ids = {}
+        for type in types:
+            self._add(type, self.types, self.type_ids)
+        for symbol in symbols:
+            self._add(symbol, self.symbols, self.symbol_ids)
+
+    @staticmethod
+    def _add(value, values, ids):
+        if value not in ids:
+            ids[value] = len(values)
+            values.append(value)
+        return ids[value]
+
+    @classmethod
+    def from_scene(cls, scene, objects, poses, abilities):
+        """
+        Builds the schema of a scene, all nodes building it from the same config get the same IDs
+        :param scene: name of the scene
+        :param objects: list of objects of the scene (/thr/objects)
+        :param poses: content of the poses.json of the scene
+        :param abilities: content of abilities.json (activities are predicates named after robot actions)
+        :return: a PredicateSchema
+        """
+        types = GENERIC_TYPES + sorted(abilities)
+        tools = []
+        num_attach_points = 0
+        for master in sorted(poses):
+            constraints = poses[master].get('constraints', [])
+            num_attach_points = max(num_attach_points, len(constraints), len(poses[master].get('hold', [])))
+            for constraint in constraints:
+                tools += [slave for slave in sorted(constraint) if slave not in objects and slave not in tools]
+        symbols = GENERIC_SYMBOLS + list(objects) + tools + [str(atp) for atp in range(num_attach_points)]
+        return cls(scene, types, symbols)
+
+    @classmethod
+    def from_msg(cls, msg):
+        return cls(msg.scene, msg.types, msg.symbols, msg.revision)
+
+    def to_msg(self):
+        return PredicateSchemaMsg(revision=self.revision, scene=self.scene, types=self.types, symbols=self.symbols)
+
+    def type_id(self, type, intern=False):
+        """
+        :param intern: if True an unknown type is added to the table (and the revision increased), otherwise None is returned
+        """
+        if intern and type not in self.type_ids:
+            self.revision += 1
+            return self._add(type, self.types, self.type_ids)
+        return self.type_ids.get(type)
+
+    def symbol_id(self, symbol, intern=False):
+        if intern and symbol not in self.symbol_ids:
+            self.revision += 1
+            return self._add(symbol, self.symbols, self.symbol_ids)
+        return self.symbol_ids.get(symbol)
+
+    def key(self, type, parameters):
+        """
+        Hashable key of a predicate, e.g. to build sets of predicates for O(1) lookups
+        :return: tuple (type_id, param_id_1, param_id_2...) or None if the predicate has unknown types or symbols
+        """
+        ids = (self.type_ids.get(type),) + tuple(self.symbol_ids.get(str(p)) for p in parameters)
+        return None if None in ids else ids
+
+    def encode(self, predicate, intern=False):
+        return CompactPredicate(type=self.type_id(predicate.type, intern),
+                                parameters=[self.symbol_id(p, intern) for p in predicate.parameters])
+
+    def decode(self, compact):
+        return Predicate(type=self.types[compact.type], parameters=[self.symbols[p] for p in compact.parameters])
+
+    def encode_state(self, scene_state, intern=False):
+        state = CompactSceneState(predicates=[self.encode(p, intern) for p in scene_state.predicates])
+        state.header = scene_state.header
+        state.schema_revision = self.revision
+        return state
+
+    def decode_state(self, compact_state):
+        state = SceneState(predicates=[self.decode(p) for p in compact_state.predicates])
+        state.header = compact_state.header
+        return state
+
+    def match(self, compact_state, type, parameters=()):
+        """
+        Checks if a compact scene state contains a predicate
+        :param type: the predicate type (string)
+        :param parameters: the first parameters to match (strings), None acts as a wildcard
+        :return: True if at least one predicate of compact_state matches
+        """
+        type_id = self.type_ids.get(type)
+        pattern = [None if p is None else self.symbol_ids.get(str(p), -1) for p in parameters]
+        if type_id is None or -1 in pattern:
+            return False
+        for predicate in compact_state.predicates:
+            if predicate.type == type_id and len(predicate.parameters) >= len(pattern) and \
+                    all(p is None or p == predicate.parameters[i] for i, p in enumerate(pattern)):
+                return True
+        return False
@@ -0,0 +1,173 @@
+import os
+import json
+import pickle
+import hashlib
+import rospkg
+import numpy as np
+from . predicates import PredicateSchema
+
+CACHE_VERSION = 1  # Increase when the compiled form changes to invalidate existing caches
+SIDES = ['left', 'right']
+APPROACH_ACTIONS = ['hold', 'pick', 'grasp']
+
+
+def _config_paths(rospack, scene):
+    return [('poses', rospack.get_path("thr_scenes")+"/config/"+scene+"/poses.json"),
+            ('display', rospack.get_path("thr_scenes")+"/config/"+scene+"/display.json"),
+            ('perception', rospack.get_path("thr_scene_state_manager")+"/config/perception.json"),
+            ('abilities', rospack.get_path("thr_action_server")+"/config/abilities.json"),
+            ('mapping', rospack.get_path("thr_action_server")+"/config/decision_action_mapping.json")]
+
+
+def _pose_to_row(pose, name):
+    try:
+        row = np.array(pose[0] + pose[1], dtype=float)
+    except (TypeError, IndexError):
+        raise ValueError("{} is not a pose [[x, y, z], [x, y, z, w]]: {}".format(name, pose))
+    if row.shape != (7,):
+        raise ValueError("{} is not a pose [[x, y, z], [x, y, z, w]]: {}".format(name, pose))
+    return row
+
+
+class SceneModel(object):
+    """
+    Configuration of a scene (poses.json, display.json, perception.json, abilities.json, decision_action_mapping.json)
+    validated once and precompiled into NumPy arrays and lookup tables for cheap per-tick access.
+    The raw configs stay available as attributes for the code that still browses them.
+    Use SceneModel.load() to get the compiled form from the on-disk cache of the host when the files did not change.
+    """
+    def __init__(self, scene, objects, poses, display, perception, abilities, mapping):
+        self.scene = scene
+        self.objects = list(objects)
+        self.poses = poses
+        self.display = display
+        self.perception = perception
+        self.abilities = abilities
+        self.mapping = mapping
+        self._validate()
+        self._compile_abilities()
+        self._compile_constraints()
+        self._compile_approaches()
+        self.schema = PredicateSchema.from_scene(scene, self.objects, poses, abilities)
+
+    @classmethod
+    def load(cls, scene, objects, rospack=None, cache_dir=None):
+        """
+        Loads the compiled model of a scene from the cache, or compiles it and caches it
+        :param scene: name of the scene (/thr/scene)
+        :param objects: list of objects of the scene (/thr/objects)
+        :param cache_dir: directory of the cache, defaults to $ROS_HOME/thr_scenes
+        :return: a SceneModel
+        """
+        rospack = rospkg.RosPack() if rospack is None else rospack
+        cache_dir = os.path.join(rospkg.get_ros_home(), 'thr_scenes') if cache_dir is None else cache_dir
+        contents = {}
+        digest = hashlib.sha1('{}:{}:{}'.format(CACHE_VERSION, scene, json.dumps(list(objects))).encode('utf-8'))
+        for name, path in _config_paths(rospack, scene):
+            with open(path, 'rb') as f:
+                contents[name] = f.read()
+            digest.update(contents[name])
+        cache_file = os.path.join(cache_dir, '{}_{}.pkl'.format(scene, digest.hexdigest()))
+
+        try:
+            with open(cache_file, 'rb') as f:
+                return pickle.load(f)
+        except Exception:
+            pass  # Missing or unreadable cache, compile it
+
+        configs = dict((name, json.loads(content.decode('utf-8'))) for name, content in contents.items())
+        model = cls(scene, objects, **configs)
+        try:
+            if not os.path.isdir(cache_dir):
+                os.makedirs(cache_dir)
+            tmp_file = '{}.{}.tmp'.format(cache_file, os.getpid())
+            with open(tmp_file, 'wb') as f:
+                pickle.dump(model, f, pickle.HIGHEST_PROTOCOL)
+            os.rename(tmp_file, cache_file)  # Atomic, nodes starting concurrently never read a partial cache
+        except (IOError, OSError):
+            pass  # Read-only home, the model is just not cached
+        return model
+
+    def _validate(self):
+        for action, side in self.abilities.items():
+            if side not in SIDES:
+                raise ValueError("abilities.json: action {} is attributed to unknown arm {}".format(action, side))
+        for decision, target in self.mapping.items():
+            if target['type'] not in self.abilities:
+                raise ValueError("decision_action_mapping.json: {} maps to action {} that no arm is capable of".format(decision, target['type']))
+            if self.abilities[target['type']] != target['client']:
+                raise ValueError("decision_action_mapping.json: {} is sent to arm {} but {} is a {} arm ability".format(
+                                 decision, target['client'], target['type'], self.abilities[target['type']]))
+        for family in ['positioned', 'attached', 'in_human_ws', 'start_position']:
+            if family not in self.perception:
+                raise ValueError("perception.json: missing section {}".format(family))
+
+    def _compile_abilities(self):
+        self.sides = dict(self.abilities)  # Action type -> arm
+        self.actions_of_side = dict((side, frozenset(a for a, s in self.abilities.items() if s == side)) for side in SIDES)
+        self.decisions = dict((decision, (target['client'], target['type'])) for decision, target in self.mapping.items())
+
+    def _compile_constraints(self):
+        """
+        All constraints master -> slave at attach point atp are stacked in a (N, 7) array of [x, y, z, qx, qy, qz, qw]
+        Constraints between 2 objects of the scene are listed in self.constraint_triples, those with tools in self.tool_constraints
+        """
+        rows = []
+        self.constraint_index = {}     # (master, slave, atp) -> row in self.constraint_transforms
+        self.constraint_triples = []   # (master, slave, atp) having a constraint, slave being an object of the scene
+        self.tool_constraints = {}     # (master, atp) -> {tool: row}
+        for master in sorted(self.poses):
+            for atp, constraint in enumerate(self.poses[master].get('constraints', [])):
+                for slave in sorted(constraint):
+                    self.constraint_index[(master, slave, atp)] = len(rows)
+                    rows.append(_pose_to_row(constraint[slave], "Constraint {}->{}#{}".format(master, slave, atp)))
+                    if slave in self.objects:
+                        if master in self.objects:
+                            self.constraint_triples.append((master, slave, atp))
+                    else:
+                        self.tool_constraints.setdefault((master, atp), {})[slave] = self.constraint_index[(master, slave, atp)]
+        self.constraint_transforms = np.array(rows, dtype=float).reshape((len(rows), 7))
+
+    def _compile_approaches(self):
+        """
+        Approach poses of grasping actions are stacked in a (N, 7) array, contact points in a (N, 3) array (NaN if undefined)
+        """
+        approaches, contacts = [], []
+        self.approach_index = {}  # (action, object, pose number) -> row in self.approach_transforms and self.contact_points
+        for obj in sorted(self.poses):
+            for action in APPROACH_ACTIONS:
+                for pose_id, pose in enumerate(self.poses[obj].get(action, [])):
+                    if 'approach' not in pose:
+                        continue
+                    self.approach_index[(action, obj, pose_id)] = len(approaches)
+                    approaches.append(_pose_to_row(pose['approach'], "Approach pose {} {}#{}".format(action, obj, pose_id)))
+                    contact = pose.get('contact', pose.get('grasp'))
+                    contacts.append(np.array(contact, dtype=float) if contact is not None else np.full(3, np.nan))
+        self.approach_transforms = np.array(approaches, dtype=float).reshape((len(approaches), 7))
+        self.contact_points = np.array(contacts, dtype=float).reshape((len(contacts), 3))
+
+    def has_constraint(self, master, slave, atp):
+        return (master, slave, atp) in self.constraint_index
+
+    def constraint(self, master, slave, atp):
+        """
+        :return: the constraint transform master -> slave at attach point atp, as [position, quaternion] arrays
+        """
+        row = self.constraint_transforms[self.constraint_index[(master, slave, atp)]]
+        return [row[:3], row[3:]]
+
+    def approach(self, action, obj, pose_id=0):
+        """
+        :return: the approach pose of action on object obj, as [position, quaternion] arrays
+        """
+        row = self.approach_transforms[self.approach_index[(action, obj, pose_id)]]
+        return [row[:3], row[3:]]
+
+    def contact(self, action, obj, pose_id=0):
+        return self.contact_points[self.approach_index[(action, obj, pose_id)]]
+
+    def side(self, action_type):
+        """
+        :return: the arm capable of this robot action or None
+        """
+        return self.sides.get(action_type)